@@ -0,0 +1,64 @@
+"""
+Time yoyo.utils.change_param_style with and without the compiled
+statement cache.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/param_style.py
+"""
+
+from datetime import datetime
+import timeit
+
+from yoyo import utils
+
+SQL = (
+    "INSERT INTO _yoyo_log "
+    "(id, migration_hash, migration_id, operation, "
+    "username, hostname, created_at_utc) "
+    "VALUES (:id, :migration_hash, :migration_id, "
+    ":operation, :username, :hostname, :created_at_utc)"
+)
+
+PARAMS = {
+    "id": "4f5b0a5e-0b1a-11eb-9b1c-acde48001122",
+    "migration_hash": "a" * 64,
+    "migration_id": "0001.create-tables",
+    "operation": "apply",
+    "username": "deployer",
+    "hostname": "deploy.example.org",
+    "created_at_utc": datetime(2020, 1, 1),
+}
+
+STYLES = ["qmark", "numeric", "format", "pyformat"]
+
+
+def uncached(style):
+    utils.compile_param_style.cache_clear()
+    return utils.change_param_style(style, SQL, PARAMS)
+
+
+def cached(style):
+    return utils.change_param_style(style, SQL, PARAMS)
+
+
+def main(number=20000):
+    print(
+        "{:>10}  {:>12}  {:>12}  {:>8}".format(
+            "style", "uncached", "cached", "speedup"
+        )
+    )
+    for style in STYLES:
+        a = min(
+            timeit.repeat(lambda: uncached(style), number=number, repeat=3)
+        )
+        b = min(timeit.repeat(lambda: cached(style), number=number, repeat=3))
+        print(
+            "{:>10}  {:>10.2f}us  {:>10.2f}us  {:>7.1f}x".format(
+                style, a / number * 1e6, b / number * 1e6, a / b
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
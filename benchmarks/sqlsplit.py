@@ -0,0 +1,63 @@
+"""
+Compare splitting SQL migrations with sqlparse and with the statement
+splitters in yoyo.sqlsplit.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/sqlsplit.py [STATEMENTS ...]
+
+The generic splitter must return the same statements as sqlparse. The
+dialect splitters may differ where the database's own syntax does (eg the
+PostgreSQL splitter treats dollar quoted function bodies as strings).
+"""
+
+import sys
+import timeit
+
+import sqlparse
+
+from yoyo import sqlsplit
+
+TEMPLATE = """\
+-- Create table {n}
+CREATE TABLE item_{n} (
+    id INT PRIMARY KEY,
+    name VARCHAR(200) NOT NULL DEFAULT 'unnamed; really',
+    created_at TIMESTAMP
+);
+INSERT INTO item_{n} (id, name) VALUES (1, 'one'), (2, 'two'), (3, 'it''s');
+/* Keep updated_at current */
+CREATE TRIGGER item_{n}_update AFTER UPDATE ON item_{n}
+BEGIN
+    UPDATE item_{n} SET created_at = CASE WHEN 1 THEN 2 END WHERE id = 1;
+END;
+"""
+
+
+def make_sql(statements):
+    return "".join(TEMPLATE.format(n=n) for n in range(statements // 3))
+
+
+def main(sizes):
+    print(
+        "{:>10}  {:>10}  {:>12}  {:>12}  {:>8}".format(
+            "statements", "dialect", "sqlparse", "sqlsplit", "speedup"
+        )
+    )
+    for size in sizes:
+        sql = make_sql(size)
+        assert sqlsplit.split(sql) == sqlparse.split(sql)
+        legacy = min(timeit.repeat(lambda: sqlparse.split(sql), number=1))
+        for dialect in sqlsplit.DIALECTS:
+            new = min(
+                timeit.repeat(lambda: sqlsplit.split(sql, dialect), number=1)
+            )
+            print(
+                "{:>10}  {:>10}  {:>10.2f}ms  {:>10.2f}ms  {:>7.1f}x".format(
+                    size, dialect, legacy * 1000, new * 1000, legacy / new
+                )
+            )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [300, 3000])
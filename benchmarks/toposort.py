@@ -0,0 +1,116 @@
+"""
+Compare yoyo.migrations.topological_sort with the previous
+dict-of-OrderedDicts implementation.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/toposort.py [SIZE ...]
+
+Each migration depends on up to three randomly chosen earlier migrations.
+"""
+
+from collections import OrderedDict
+from collections import defaultdict
+from collections import deque
+from itertools import chain
+import random
+import sys
+import timeit
+
+from yoyo.migrations import topological_sort
+
+
+class FakeMigration(object):
+    def __init__(self, id):
+        self.id = id
+        self.depends = set()
+
+
+def make_migrations(size, max_depends=3, seed=0):
+    rng = random.Random(seed)
+    migrations = [FakeMigration(str(n)) for n in range(size)]
+    for ix, m in enumerate(migrations[1:], 1):
+        for _ in range(rng.randint(0, max_depends)):
+            m.depends.add(migrations[rng.randrange(ix)])
+    rng.shuffle(migrations)
+    return migrations
+
+
+def legacy_topological_sort(migration_list):
+    L = list()
+    migration_list = list(migration_list)
+    valid_migrations = set(migration_list)
+    forward_edges = defaultdict(OrderedDict)
+    backward_edges = defaultdict(OrderedDict)
+
+    for m in migration_list:
+        for n in m.depends:
+            if n not in valid_migrations:
+                continue
+            forward_edges[n][m] = 1
+            backward_edges[m][n] = 1
+
+    to_toposort = set(chain(forward_edges, backward_edges))
+    S = deque(
+        m
+        for m in to_toposort
+        if not any(n in valid_migrations for n in m.depends)
+    )
+    while S:
+        n = S.popleft()
+        L.append(n)
+        for m in list(forward_edges[n]):
+            del forward_edges[n][m]
+            del backward_edges[m][n]
+            if not backward_edges[m]:
+                S.append(m)
+
+    if any(forward_edges.values()):
+        raise ValueError("Circular dependencies")
+    return L + [m for m in migration_list if m not in to_toposort]
+
+
+def check_sorted(result):
+    position = {m: ix for ix, m in enumerate(result)}
+    assert all(position[d] < position[m] for m in result for d in m.depends)
+
+
+def main(sizes):
+    print(
+        "{:>8}  {:>12}  {:>12}  {:>8}".format(
+            "nodes", "legacy", "new", "speedup"
+        )
+    )
+    for size in sizes:
+        migrations = make_migrations(size)
+        check_sorted(topological_sort(migrations))
+        number = max(1, 10000 // size)
+        legacy = (
+            min(
+                timeit.repeat(
+                    lambda: legacy_topological_sort(migrations),
+                    number=number,
+                    repeat=3,
+                )
+            )
+            / number
+        )
+        new = (
+            min(
+                timeit.repeat(
+                    lambda: topological_sort(migrations),
+                    number=number,
+                    repeat=3,
+                )
+            )
+            / number
+        )
+        print(
+            "{:>8}  {:>10.2f}ms  {:>10.2f}ms  {:>7.1f}x".format(
+                size, legacy * 1000, new * 1000, legacy / new
+            )
+        )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 100000])
@@ -24,14 +24,39 @@ __all__ = [
     "transaction",
 ]
 
-from yoyo.connections import get_backend
-from yoyo.migrations import ancestors
-from yoyo.migrations import default_migration_table
-from yoyo.migrations import descendants
-from yoyo.migrations import group
-from yoyo.migrations import logger
-from yoyo.migrations import read_migrations
-from yoyo.migrations import step
-from yoyo.migrations import transaction
+#: Names exported by this package, and the modules they are imported from.
+#: These are imported on first access so that ``import yoyo`` (eg in every
+#: migration file, or when starting the command line tool) does not load
+#: the database backends.
+_lazy_names = {
+    "ancestors": "yoyo.migrations",
+    "default_migration_table": "yoyo.migrations",
+    "descendants": "yoyo.migrations",
+    "get_backend": "yoyo.connections",
+    "group": "yoyo.migrations",
+    "logger": "yoyo.migrations",
+    "read_migrations": "yoyo.migrations",
+    "step": "yoyo.migrations",
+    "transaction": "yoyo.migrations",
+}
+
+
+def __getattr__(name):
+    try:
+        module_name = _lazy_names[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    from importlib import import_module
+
+    value = getattr(import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
 
 __version__ = "y"
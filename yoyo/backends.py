@@ -12,14 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from collections.abc import Mapping
+from configparser import ConfigParser
 from datetime import datetime
 from contextlib import contextmanager
+from contextlib import nullcontext
+from functools import lru_cache
 from importlib import import_module
+from itertools import chain
 from itertools import count
 from logging import getLogger
 
 import getpass
+import hashlib
 import os
 import socket
 import time
@@ -32,6 +38,29 @@ from .migrations import topological_sort
 
 logger = getLogger("yoyo.migrations")
 
+BOOLEAN_STATES = ConfigParser.BOOLEAN_STATES
+
+
+@lru_cache()
+def get_username():
+    """
+    Return the name of the current user, as recorded in the log table.
+    May be overridden by setting the ``YOYO_USERNAME`` environment variable.
+    """
+    return os.environ.get("YOYO_USERNAME") or getpass.getuser()
+
+
+@lru_cache()
+def get_hostname():
+    """
+    Return the fully qualified name of the current host, as recorded in the
+    log table. May be overridden by setting the ``YOYO_HOSTNAME``
+    environment variable.
+
+    The result is cached as looking up the name can block on DNS.
+    """
+    return os.environ.get("YOYO_HOSTNAME") or socket.getfqdn()
+
 
 class TransactionManager(object):
     """
@@ -109,6 +138,45 @@ class SavepointTransactionManager(TransactionManager):
         self.backend.savepoint_rollback(self.id)
 
 
+class AppliedMigrations(object):
+    """
+    The migrations recorded as applied in a database.
+
+    Maps migration hashes to the time they were applied, ordered by
+    application time. Membership tests are constant time.
+    """
+
+    def __init__(self, rows=()):
+        self._applied_at = OrderedDict(rows)
+
+    def __repr__(self):
+        return "<{} ({} migrations)>".format(
+            self.__class__.__name__, len(self)
+        )
+
+    def __contains__(self, migration_hash):
+        return migration_hash in self._applied_at
+
+    def __iter__(self):
+        return iter(self._applied_at)
+
+    def __len__(self):
+        return len(self._applied_at)
+
+    def applied_at(self, migration_hash):
+        """
+        Return the time at which the given migration was applied
+        """
+        return self._applied_at[migration_hash]
+
+    def add(self, migration_hash, applied_at):
+        self._applied_at.pop(migration_hash, None)
+        self._applied_at[migration_hash] = applied_at
+
+    def discard(self, migration_hash):
+        self._applied_at.pop(migration_hash, None)
+
+
 class DatabaseBackend(object):
 
     driver_module = None
@@ -117,6 +185,10 @@ class DatabaseBackend(object):
     log_table = "_yoyo_log"
     lock_table = "yoyo_lock"
     list_tables_sql = "SELECT table_name FROM information_schema.tables"
+    tables_exist_sql = (
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_name IN ({placeholders})"
+    )
     version_table = "_yoyo_version"
     migration_table = "_yoyo_migrations"
     is_applied_sql = """
@@ -129,10 +201,10 @@ class DatabaseBackend(object):
     )
     unmark_migration_sql = (
         "DELETE FROM {0.migration_table_quoted} WHERE "
-        "migration_hash = :migration_hash"
+        "migration_hash IN ({placeholders})"
     )
     applied_migrations_sql = (
-        "SELECT migration_hash FROM "
+        "SELECT migration_hash, applied_at_utc FROM "
         "{0.migration_table_quoted} "
         "ORDER by applied_at_utc"
     )
@@ -153,20 +225,73 @@ class DatabaseBackend(object):
         "pid INT NOT NULL,"
         "PRIMARY KEY (locked))"
     )
+    insert_lock_sql = (
+        "INSERT INTO {0.lock_table_quoted} (locked, ctime, pid) "
+        "VALUES (1, :when, :pid)"
+    )
+    select_lock_sql = "SELECT pid FROM {0.lock_table_quoted}"
+    delete_lock_sql = "DELETE FROM {0.lock_table_quoted} WHERE pid=:pid"
+    break_lock_sql = "DELETE FROM {0.lock_table_quoted}"
+
+    #: The maximum number of bind parameters to use in a single statement
+    max_bind_params = 999
+
+    #: The username and hostname recorded in the log table. If ``None``,
+    #: these are looked up once per process.
+    log_username = None
+    log_hostname = None
+
+    #: How to display rows returned by migration steps: one of
+    #: ``yoyo.output.OUTPUT_MODES``. At most ``output_max_rows`` rows are
+    #: read, and output is appended to ``output_file`` if set.
+    output_mode = "table"
+    output_max_rows = None
+    output_file = None
 
     _driver = None
+    _statements = None
+    _has_transactional_ddl = None
+    _lock_table_created = False
     _is_locked = False
     _in_transaction = False
+    _applied_migrations = None
     _internal_schema_updated = False
 
     def __init__(self, dburi, migration_table):
         self.uri = dburi
         self.DatabaseError = self.driver.DatabaseError
+        args = getattr(dburi, "args", None)
+        if args and "transactional_ddl" in args:
+            args = dict(args)
+            value = args.pop("transactional_ddl")
+            try:
+                self.has_transactional_ddl = BOOLEAN_STATES[value.lower()]
+            except KeyError:
+                raise ValueError(
+                    "Invalid value for transactional_ddl: {!r}".format(value)
+                )
+            dburi = dburi._replace(args=args)
         self._connection = self.connect(dburi)
         self.init_connection(self._connection)
         self.migration_table = migration_table
-        self.create_lock_table()
-        self.has_transactional_ddl = self._check_transactional_ddl()
+
+    @property
+    def has_transactional_ddl(self):
+        """
+        True if the database supports committing/rolling back DDL
+        statements within a transaction.
+
+        Backends for databases with known behaviour set this as a class
+        attribute. Otherwise it is detected the first time it is needed,
+        unless given in the connection URI (eg ``?transactional_ddl=false``).
+        """
+        if self._has_transactional_ddl is None:
+            self._has_transactional_ddl = self._check_transactional_ddl()
+        return self._has_transactional_ddl
+
+    @has_transactional_ddl.setter
+    def has_transactional_ddl(self, value):
+        self._has_transactional_ddl = value
 
     def _load_driver_module(self):
         """
@@ -234,6 +359,30 @@ class DatabaseBackend(object):
         )
         return [row[0] for row in cursor.fetchall()]
 
+    def tables_exist(self, names):
+        """
+        Return the set of tables in ``names`` that are present in the
+        backend. Unlike :meth:`list_tables` this only looks up the
+        requested names.
+        """
+        params = {"t{}".format(n): name for n, name in enumerate(names)}
+        if not params:
+            return set()
+        statement_name = "tables_exist_{}".format(len(params))
+        if statement_name not in self.statements:
+            self.statements[statement_name] = self.compile_statement(
+                self.tables_exist_sql,
+                placeholders=", ".join(":" + k for k in params),
+            )
+        cursor = self.execute_statement(statement_name, params)
+        return {row[0] for row in cursor.fetchall()}
+
+    def table_exists(self, name):
+        """
+        Return True if the table ``name`` is present in the backend
+        """
+        return name in self.tables_exist([name])
+
     def transaction(self):
         if not self._in_transaction:
             return TransactionManager(self)
@@ -252,6 +401,7 @@ class DatabaseBackend(object):
         self.connection.rollback()
         self.init_connection(self.connection)
         self._in_transaction = False
+        self._applied_migrations = None
 
     def begin(self):
         """
@@ -277,6 +427,7 @@ class DatabaseBackend(object):
         Rollback the savepoint with the given id
         """
         self.execute("ROLLBACK TO SAVEPOINT {}".format(id))
+        self._applied_migrations = None
 
     @contextmanager
     def disable_transactions(self):
@@ -299,32 +450,48 @@ class DatabaseBackend(object):
             return
 
         pid = os.getpid()
-        self._insert_lock_row(pid, timeout)
+        self._acquire_lock(pid, timeout)
         try:
             self._is_locked = True
+            self._applied_migrations = None
             yield
-            self._is_locked = False
         finally:
-            self._delete_lock_row(pid)
+            self._is_locked = False
+            self._applied_migrations = None
+            self._release_lock(pid)
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire the migration lock, waiting up to ``timeout`` seconds.
+
+        The default implementation inserts a row into the lock table.
+        Backends may override this to use a native locking mechanism.
+        """
+        self._insert_lock_row(pid, timeout)
+
+    def _release_lock(self, pid):
+        self._delete_lock_row(pid)
+
+    @property
+    def lock_name(self):
+        """
+        A name for the migration lock, unique to the migration table
+        """
+        return "yoyo:{}".format(self.migration_table)
 
     def _insert_lock_row(self, pid, timeout, poll_interval=0.5):
+        self.create_lock_table()
         poll_interval = min(poll_interval, timeout)
         started = time.time()
         while True:
             try:
                 with self.transaction():
-                    self.execute(
-                        "INSERT INTO {} (locked, ctime, pid) "
-                        "VALUES (1, :when, :pid)".format(
-                            self.lock_table_quoted
-                        ),
-                        {"when": datetime.utcnow(), "pid": pid},
+                    self.execute_statement(
+                        "insert_lock", {"when": datetime.utcnow(), "pid": pid}
                     )
             except self.DatabaseError:
                 if timeout and time.time() > started + timeout:
-                    cursor = self.execute(
-                        "SELECT pid FROM {}".format(self.lock_table_quoted)
-                    )
+                    cursor = self.execute_statement("select_lock")
                     row = cursor.fetchone()
                     if row:
                         raise exceptions.LockTimeout(
@@ -344,14 +511,12 @@ class DatabaseBackend(object):
 
     def _delete_lock_row(self, pid):
         with self.transaction():
-            self.execute(
-                "DELETE FROM {} WHERE pid=:pid".format(self.lock_table_quoted),
-                {"pid": pid},
-            )
+            self.execute_statement("delete_lock", {"pid": pid})
 
     def break_lock(self):
+        self.create_lock_table()
         with self.transaction():
-            self.execute("DELETE FROM {}".format(self.lock_table_quoted))
+            self.execute_statement("break_lock")
 
     def execute(self, sql, params=None):
         """
@@ -372,15 +537,108 @@ class DatabaseBackend(object):
         cursor.execute(sql, params)
         return cursor
 
+    def executemany(self, sql, params_seq):
+        """
+        Create a new cursor, execute a single statement once for each
+        dictionary of parameters in ``params_seq`` and return the cursor
+        object.
+        """
+        converted = []
+        for params in params_seq:
+            if not isinstance(params, Mapping):
+                raise TypeError("Expected dict or other mapping object")
+            converted.append(
+                utils.change_param_style(self.driver.paramstyle, sql, params)
+            )
+        cursor = self.cursor()
+        if converted:
+            self._executemany(
+                cursor, converted[0][0], [p for _, p in converted]
+            )
+        return cursor
+
+    def _executemany(self, cursor, sql, params_seq):
+        cursor.executemany(sql, params_seq)
+
+    def get_statement_templates(self):
+        """
+        Return a dict of the SQL statements used internally by the backend.
+
+        Statements are formatted with the backend object as the first
+        argument, and use named bind parameters.
+        """
+        return {
+            "mark_migration": self.mark_migration_sql,
+            "applied_migrations": self.applied_migrations_sql,
+            "log_migration": self.log_migration_sql,
+            "create_lock_table": self.create_lock_table_sql,
+            "insert_lock": self.insert_lock_sql,
+            "select_lock": self.select_lock_sql,
+            "delete_lock": self.delete_lock_sql,
+            "break_lock": self.break_lock_sql,
+        }
+
+    @property
+    def statements(self):
+        """
+        A dict of the backend's internal statements, as
+        :class:`~yoyo.utils.CompiledStatement` objects ready to pass to the
+        driver. This is built on first use and kept for the lifetime of the
+        connection.
+        """
+        if self._statements is None:
+            self._statements = {
+                name: self.compile_statement(sql)
+                for name, sql in self.get_statement_templates().items()
+            }
+        return self._statements
+
+    def compile_statement(self, sql, **kwargs):
+        """
+        Format ``sql`` with the backend object and ``kwargs``, and rewrite
+        it for the driver's paramstyle
+        """
+        return utils.compile_param_style(
+            self.driver.paramstyle, sql.format(self, **kwargs)
+        )
+
+    def execute_statement(self, name, params=None):
+        """
+        Execute the named statement from :attr:`statements` and return the
+        cursor object.
+        """
+        statement = self.statements[name]
+        cursor = self.cursor()
+        cursor.execute(statement.sql, statement.bind(params))
+        return cursor
+
+    def executemany_statement(self, name, params_seq):
+        """
+        Execute the named statement from :attr:`statements` once for each
+        dict of parameters in ``params_seq`` and return the cursor object.
+        """
+        statement = self.statements[name]
+        params_seq = [statement.bind(params) for params in params_seq]
+        cursor = self.cursor()
+        if params_seq:
+            self._executemany(cursor, statement.sql, params_seq)
+        return cursor
+
     def create_lock_table(self):
         """
         Create the lock table if it does not already exist.
+
+        This is called before the lock table is first used, so only
+        backends that lock using the table need it.
         """
+        if self._lock_table_created:
+            return
         try:
             with self.transaction():
-                self.execute(self.create_lock_table_sql.format(self))
+                self.execute_statement("create_lock_table")
         except self.DatabaseError:
             pass
+        self._lock_table_created = True
 
     def ensure_internal_schema_updated(self):
         """
@@ -393,26 +651,55 @@ class DatabaseBackend(object):
             with self.lock():
                 internalmigrations.upgrade(self)
                 self.connection.commit()
-                self._internal_schema_updated = True
+        self._internal_schema_updated = True
 
     def is_applied(self, migration):
-        return migration.hash in self.get_applied_migration_hashes()
+        return migration.hash in self.get_applied_migrations()
+
+    def applied_status(self, migrations):
+        """
+        Return a dict mapping each of ``migrations`` to ``True`` if it has
+        been applied, or ``False`` otherwise.
+
+        The migration table is queried at most once, however many
+        migrations are passed.
+        """
+        applied = self.get_applied_migrations()
+        return {m: m.hash in applied for m in migrations}
+
+    def get_applied_migrations(self):
+        """
+        Return an :class:`AppliedMigrations` object recording the migrations
+        applied to the database.
+
+        While the migration lock is held the result is kept and updated as
+        migrations are marked and unmarked, so that the migration table is
+        only read once.
+        """
+        if self._applied_migrations is not None:
+            return self._applied_migrations
+        self.ensure_internal_schema_updated()
+        cursor = self.execute_statement("applied_migrations")
+        applied = AppliedMigrations(
+            (row[0], row[1]) for row in cursor.fetchall()
+        )
+        if self._is_locked:
+            self._applied_migrations = applied
+        return applied
 
     def get_applied_migration_hashes(self):
         """
         Return the list of migration hashes in the order in which they
         were applied
         """
-        self.ensure_internal_schema_updated()
-        sql = self.applied_migrations_sql.format(self)
-        return [row[0] for row in self.execute(sql).fetchall()]
+        return list(self.get_applied_migrations())
 
     def to_apply(self, migrations):
         """
         Return the subset of migrations not already applied.
         """
-        applied = self.get_applied_migration_hashes()
-        ms = (m for m in migrations if m.hash not in applied)
+        applied = self.applied_status(migrations)
+        ms = (m for m in migrations if not applied[m])
         return migrations.__class__(
             topological_sort(ms), migrations.post_apply
         )
@@ -424,29 +711,95 @@ class DatabaseBackend(object):
 
         The order of migrations will be reversed.
         """
-        applied = self.get_applied_migration_hashes()
-        ms = (m for m in migrations if m.hash in applied)
+        applied = self.applied_status(migrations)
+        ms = (m for m in migrations if applied[m])
         return migrations.__class__(
             reversed(topological_sort(ms)), migrations.post_apply
         )
 
-    def apply_migrations(self, migrations, force=False):
-        if migrations:
+    def apply_migrations(
+        self, migrations, force=False, single_transaction=False
+    ):
+        """
+        Apply the list of migrations, then run any post-apply hooks.
+
+        :param single_transaction: if true, apply all migrations and hooks
+                                   in a single transaction, so that either
+                                   all or none are committed
+        :raises SingleTransactionUnavailable: if ``single_transaction`` is
+                                              set but the migrations can't
+                                              be run in a transaction
+        :raises BadMigration: if a migration can't be loaded. No migrations
+                              are applied.
+        """
+        if not migrations:
+            return
+        if not single_transaction:
             self.apply_migrations_only(migrations, force=force)
             self.run_post_apply(migrations, force=force)
+            return
+        self.check_single_transaction(migrations)
+        self.ensure_internal_schema_updated()
+        with self.transaction():
+            # Unlike apply_migrations_only, don't skip bad migrations: any
+            # error must roll back the whole transaction
+            for m in migrations:
+                self.apply_one(m, force=force)
+            self.run_post_apply(migrations, force=force)
+
+    def check_single_transaction(self, migrations):
+        """
+        Raise :class:`~yoyo.exceptions.SingleTransactionUnavailable` unless
+        ``migrations`` and their post-apply hooks can be applied in a single
+        transaction.
+
+        Migrations are loaded in full, so that any that fail to load are
+        reported before the transaction is started.
+        """
+        if not self.has_transactional_ddl:
+            raise exceptions.SingleTransactionUnavailable(
+                "{} does not support transactional DDL".format(
+                    self.__class__.__name__
+                )
+            )
+        self.load_migrations(
+            chain(migrations, getattr(migrations, "post_apply", []))
+        )
+        for m in chain(migrations, getattr(migrations, "post_apply", [])):
+            if not m.use_transactions:
+                raise exceptions.SingleTransactionUnavailable(
+                    "Migration {} cannot be run in a transaction".format(m.id)
+                )
+
+    def load_migrations(self, migrations):
+        """
+        Fully load each of ``migrations``.
+
+        Python migrations are not imported when their metadata can be read
+        statically. Loading them all before any are run means that a
+        migration that fails to import stops the run, rather than being
+        skipped while the migrations that depend on it are run.
+
+        :raises BadMigration: if a migration can't be loaded
+        """
+        for m in migrations:
+            m.load()
 
     def apply_migrations_only(self, migrations, force=False):
         """
         Apply the list of migrations, but do not run any post-apply hooks
         present.
+
+        :raises BadMigration: if a migration can't be loaded. No migrations
+                              are applied.
         """
         if not migrations:
             return
+        self.load_migrations(
+            chain(migrations, getattr(migrations, "post_apply", []))
+        )
         for m in migrations:
-            try:
-                self.apply_one(m, force=force)
-            except exceptions.BadMigration:
-                continue
+            self.apply_one(m, force=force)
 
     def run_post_apply(self, migrations, force=False):
         """
@@ -456,32 +809,28 @@ class DatabaseBackend(object):
             self.apply_one(m, mark=False, force=force)
 
     def rollback_migrations(self, migrations, force=False):
+        """
+        Roll back the list of migrations.
+
+        :raises BadMigration: if a migration can't be loaded. No migrations
+                              are rolled back.
+        """
         self.ensure_internal_schema_updated()
         if not migrations:
             return
+        self.load_migrations(migrations)
         for m in migrations:
-            try:
-                self.rollback_one(m, force)
-            except exceptions.BadMigration:
-                continue
+            self.rollback_one(m, force)
 
     def mark_migrations(self, migrations):
         self.ensure_internal_schema_updated()
         with self.transaction():
-            for m in migrations:
-                try:
-                    self.mark_one(m)
-                except exceptions.BadMigration:
-                    continue
+            self.mark_many(migrations)
 
     def unmark_migrations(self, migrations):
         self.ensure_internal_schema_updated()
         with self.transaction():
-            for m in migrations:
-                try:
-                    self.unmark_one(m)
-                except exceptions.BadMigration:
-                    continue
+            self.unmark_many(migrations)
 
     def apply_one(self, migration, force=False, mark=True):
         """
@@ -489,11 +838,13 @@ class DatabaseBackend(object):
         """
         logger.info("Applying %s", migration.id)
         self.ensure_internal_schema_updated()
-        migration.process_steps(self, "apply", force=force)
-        self.log_migration(migration, "apply")
-        if mark:
-            with self.transaction():
-                self.mark_one(migration, log=False)
+
+        def record():
+            self.log_migration(migration, "apply")
+            if mark:
+                self.mark_many([migration], log=False)
+
+        self._process_and_record(migration, "apply", force, record)
 
     def rollback_one(self, migration, force=False):
         """
@@ -501,36 +852,99 @@ class DatabaseBackend(object):
         """
         logger.info("Rolling back %s", migration.id)
         self.ensure_internal_schema_updated()
-        migration.process_steps(self, "rollback", force=force)
-        self.log_migration(migration, "rollback")
-        with self.transaction():
-            self.unmark_one(migration, log=False)
+
+        def record():
+            self.log_migration(migration, "rollback")
+            self.unmark_many([migration], log=False)
+
+        self._process_and_record(migration, "rollback", force, record)
+
+    def _process_and_record(self, migration, direction, force, record):
+        """
+        Run the migration's steps, then call ``record`` to write the log and
+        migration table entries.
+
+        If the migration's steps are run in a transaction that can contain
+        DDL, the entries are written in the same transaction, so that they
+        are committed together. Otherwise they are written in a separate
+        transaction once the steps have completed.
+        """
+        migration.load()
+        if self.has_transactional_ddl and migration.use_transactions:
+            if self._in_transaction:
+                transaction = nullcontext()
+            else:
+                transaction = self.transaction()
+            with transaction:
+                migration.process_steps(self, direction, force=force)
+                record()
+        else:
+            migration.process_steps(self, direction, force=force)
+            with self.transaction():
+                record()
 
     def unmark_one(self, migration, log=True):
+        self.unmark_many([migration], log=log)
+
+    def mark_one(self, migration, log=True):
+        self.mark_many([migration], log=log)
+
+    def unmark_many(self, migrations, log=True):
+        """
+        Remove ``migrations`` from the migration table, deleting up to
+        :attr:`max_bind_params` rows per statement
+        """
         self.ensure_internal_schema_updated()
-        sql = self.unmark_migration_sql.format(self)
-        self.execute(sql, {"migration_hash": migration.hash})
+        migrations = list(migrations)
+        for ix in range(0, len(migrations), self.max_bind_params):
+            chunk = migrations[ix : ix + self.max_bind_params]
+            params = {"h{}".format(n): m.hash for n, m in enumerate(chunk)}
+            name = "unmark_migration_{}".format(len(chunk))
+            if name not in self.statements:
+                self.statements[name] = self.compile_statement(
+                    self.unmark_migration_sql,
+                    placeholders=", ".join(":" + k for k in params),
+                )
+            self.execute_statement(name, params)
+        if self._applied_migrations is not None:
+            for m in migrations:
+                self._applied_migrations.discard(m.hash)
         if log:
-            self.log_migration(migration, "unmark")
+            self.log_migrations(migrations, "unmark")
 
-    def mark_one(self, migration, log=True):
+    def mark_many(self, migrations, log=True):
+        """
+        Insert ``migrations`` into the migration table with a single
+        ``executemany`` call
+        """
         self.ensure_internal_schema_updated()
-        logger.info("Marking %s applied", migration.id)
-        sql = self.mark_migration_sql.format(self)
-        self.execute(
-            sql,
-            {
-                "migration_hash": migration.hash,
-                "migration_id": migration.id,
-                "when": datetime.utcnow(),
-            },
-        )
+        rows = []
+        for m in migrations:
+            logger.info("Marking %s applied", m.id)
+            rows.append(
+                {
+                    "migration_hash": m.hash,
+                    "migration_id": m.id,
+                    "when": datetime.utcnow(),
+                }
+            )
+        self.executemany_statement("mark_migration", rows)
+        if self._applied_migrations is not None:
+            for row in rows:
+                self._applied_migrations.add(
+                    row["migration_hash"], row["when"]
+                )
         if log:
-            self.log_migration(migration, "mark")
+            self.log_migrations(migrations, "mark")
 
     def log_migration(self, migration, operation, comment=None):
-        sql = self.log_migration_sql.format(self)
-        self.execute(sql, self.get_log_data(migration, operation, comment))
+        self.log_migrations([migration], operation, comment)
+
+    def log_migrations(self, migrations, operation, comment=None):
+        self.executemany_statement(
+            "log_migration",
+            [self.get_log_data(m, operation, comment) for m in migrations],
+        )
 
     def get_log_data(self, migration=None, operation="apply", comment=None):
         """
@@ -541,8 +955,8 @@ class DatabaseBackend(object):
             "id": str(uuid.uuid1()),
             "migration_id": migration.id if migration else None,
             "migration_hash": migration.hash if migration else None,
-            "username": getpass.getuser(),
-            "hostname": socket.getfqdn(),
+            "username": self.log_username or get_username(),
+            "hostname": self.log_hostname or get_hostname(),
             "created_at_utc": datetime.utcnow(),
             "operation": operation,
             "comment": comment,
@@ -568,7 +982,14 @@ class ODBCBackend(DatabaseBackend):
 class OracleBackend(DatabaseBackend):
 
     driver_module = "cx_Oracle"
+    _has_transactional_ddl = False
     list_tables_sql = "SELECT table_name FROM all_tables WHERE owner=user"
+    tables_exist_sql = (
+        "SELECT table_name FROM all_tables "
+        "WHERE owner=user AND table_name IN ({placeholders})"
+    )
+    # Oracle allows up to 1000 expressions in an IN list
+    max_bind_params = 1000
 
     def begin(self):
         """Oracle is always in a transaction, and has no "BEGIN" statement."""
@@ -599,10 +1020,19 @@ class OracleBackend(DatabaseBackend):
 class MySQLBackend(DatabaseBackend):
 
     driver_module = "pymysql"
+    _has_transactional_ddl = False
+    max_bind_params = 10000
+    _sql_mode = None
+    _sql_mode_connection = None
+    _quoted_identifiers = None
     list_tables_sql = (
         "SELECT table_name FROM information_schema.tables "
         "WHERE table_schema = :database"
     )
+    tables_exist_sql = (
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name IN ({placeholders})"
+    )
 
     def connect(self, dburi):
         kwargs = {"db": dburi.database}
@@ -638,11 +1068,99 @@ class MySQLBackend(DatabaseBackend):
         kwargs["db"] = dburi.database
         return self.driver.connect(**kwargs)
 
+    @property
+    def lock_name(self):
+        # GET_LOCK names are shared by all databases on the server, and may
+        # be no more than 64 characters long
+        name = "{}.{}".format(self.uri.database, self.migration_table)
+        digest = hashlib.sha256(name.encode("UTF-8")).hexdigest()
+        return "yoyo:{}".format(digest[:32])
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire a named lock with ``GET_LOCK``. This is held by the
+        connection, so is released by the server if the process dies.
+        """
+        with self.transaction():
+            result = self.execute_statement(
+                "get_lock", {"name": self.lock_name, "timeout": timeout or -1}
+            ).fetchone()[0]
+        if result != 1:
+            raise exceptions.LockTimeout(
+                "Timed out waiting for lock {!r}".format(self.lock_name)
+            )
+
+    def _release_lock(self, pid):
+        with self.transaction():
+            self.execute_statement("release_lock", {"name": self.lock_name})
+
+    def lock_holder(self):
+        """
+        Return the id of the connection holding the migration lock, or None
+        if the lock is free
+        """
+        with self.transaction():
+            return self.execute_statement(
+                "is_used_lock", {"name": self.lock_name}
+            ).fetchone()[0]
+
+    def break_lock(self):
+        """
+        Clear any lock left in the lock table by older versions of yoyo.
+
+        Locks taken with ``GET_LOCK`` are released when the connection
+        holding them closes, so can't be broken from another connection.
+
+        :raises LockHeld: if another connection holds the lock
+        """
+        super(MySQLBackend, self).break_lock()
+        holder = self.lock_holder()
+        if holder is not None:
+            raise exceptions.LockHeld(
+                "The migration lock is held by MySQL connection {0}. "
+                "Stop the yoyo process holding it, or end the connection "
+                "with 'KILL {0}'".format(holder)
+            )
+
+    def init_connection(self, connection):
+        super(MySQLBackend, self).init_connection(connection)
+        if connection is not self._sql_mode_connection:
+            self._sql_mode = None
+            self._statements = None
+
+    def get_statement_templates(self):
+        return dict(
+            super(MySQLBackend, self).get_statement_templates(),
+            get_lock="SELECT GET_LOCK(:name, :timeout)",
+            release_lock="SELECT RELEASE_LOCK(:name)",
+            is_used_lock="SELECT IS_USED_LOCK(:name)",
+        )
+
+    @property
+    def sql_mode(self):
+        """
+        The connection's ``sql_mode``. This is read once per connection.
+        """
+        if self._sql_mode is None:
+            self._sql_mode = self.execute(
+                "SHOW VARIABLES LIKE 'sql_mode'"
+            ).fetchone()[1]
+            self._sql_mode_connection = self.connection
+            self._quoted_identifiers = {}
+        return self._sql_mode
+
     def quote_identifier(self, identifier):
-        sql_mode = self.execute("SHOW VARIABLES LIKE 'sql_mode'").fetchone()[1]
+        sql_mode = self.sql_mode
+        try:
+            return self._quoted_identifiers[identifier]
+        except KeyError:
+            pass
         if "ansi_quotes" in sql_mode.lower():
-            return super(MySQLBackend).quote_identifier(identifier)
-        return "`{}`".format(identifier)
+            quoted = super(MySQLBackend, self).quote_identifier(identifier)
+        else:
+            quoted = "`{}`".format(identifier)
+        self._quoted_identifiers[identifier] = quoted
+        return quoted
 
 
 class MySQLdbBackend(MySQLBackend):
@@ -652,7 +1170,12 @@ class MySQLdbBackend(MySQLBackend):
 class SQLiteBackend(DatabaseBackend):
 
     driver_module = "sqlite3"
+    _has_transactional_ddl = True
     list_tables_sql = "SELECT name FROM sqlite_master WHERE type = 'table'"
+    tables_exist_sql = (
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'table' AND name IN ({placeholders})"
+    )
 
     def connect(self, dburi):
         conn = self.driver.connect(
@@ -665,11 +1188,23 @@ class SQLiteBackend(DatabaseBackend):
 class PostgresqlBackend(DatabaseBackend):
 
     driver_module = "psycopg2"
+    _has_transactional_ddl = True
     schema = None
+    #: SQLSTATE raised when lock_timeout expires
+    lock_not_available = "55P03"
+    max_bind_params = 10000
     list_tables_sql = (
         "SELECT table_name FROM information_schema.tables "
         "WHERE table_schema = :schema"
     )
+    # to_regclass resolves each name with a catalog index lookup, rather
+    # than scanning information_schema
+    tables_exist_sql = (
+        "SELECT name FROM unnest(ARRAY[{placeholders}]::text[]) AS name "
+        "WHERE to_regclass("
+        "quote_ident(current_schema()) || '.' || quote_ident(name)"
+        ") IS NOT NULL"
+    )
 
     def connect(self, dburi):
         kwargs = {"dbname": dburi.database}
@@ -693,6 +1228,110 @@ class PostgresqlBackend(DatabaseBackend):
             yield
             self.connection.autocommit = saved
 
+    def _executemany(self, cursor, sql, params_seq):
+        # psycopg2's executemany makes a round trip per row; execute_batch
+        # sends them in pages
+        extras = import_module("{}.extras".format(self.driver_module))
+        extras.execute_batch(cursor, sql, params_seq)
+
+    def get_statement_templates(self):
+        return dict(
+            super(PostgresqlBackend, self).get_statement_templates(),
+            advisory_lock="SELECT pg_advisory_lock(:key)",
+            try_advisory_lock="SELECT pg_try_advisory_lock(:key)",
+            advisory_unlock="SELECT pg_advisory_unlock(:key)",
+            # A bigint advisory lock key is shown in pg_locks split into
+            # its high (classid) and low (objid) 32 bits, with objsubid 1
+            advisory_lock_holder=(
+                "SELECT pid FROM pg_locks "
+                "WHERE locktype = 'advisory' AND granted "
+                "AND database = (SELECT oid FROM pg_database "
+                "WHERE datname = current_database()) "
+                "AND classid::bigint = :classid "
+                "AND objid::bigint = :objid "
+                "AND objsubid = 1"
+            ),
+        )
+
+    @property
+    def lock_key(self):
+        """
+        The migration lock's key: a signed 64 bit integer derived from the
+        lock name, as required by ``pg_advisory_lock``
+        """
+        name = "{}:{}".format(self.lock_name, self.schema or "")
+        digest = hashlib.sha256(name.encode("UTF-8")).digest()
+        return int.from_bytes(digest[:8], "big", signed=True)
+
+    def _acquire_lock(self, pid, timeout):
+        """
+        Acquire a session level advisory lock. Waiting processes are woken
+        by the server when the lock is released, and the lock is released
+        automatically if the process dies.
+        """
+        if self.try_lock():
+            return
+        try:
+            with self.transaction():
+                self.execute(
+                    "SET LOCAL lock_timeout = {:d}".format(
+                        max(1, int(timeout * 1000)) if timeout else 0
+                    )
+                )
+                self.execute_statement("advisory_lock", {"key": self.lock_key})
+        except self.DatabaseError as e:
+            if getattr(e, "pgcode", None) != self.lock_not_available:
+                raise
+            raise exceptions.LockTimeout(
+                "Timed out waiting for advisory lock {}".format(self.lock_key)
+            )
+
+    def try_lock(self):
+        """
+        Try to acquire the migration lock without waiting.
+
+        :return: True if the lock was acquired
+        """
+        with self.transaction():
+            return self.execute_statement(
+                "try_advisory_lock", {"key": self.lock_key}
+            ).fetchone()[0]
+
+    def _release_lock(self, pid):
+        with self.transaction():
+            self.execute_statement("advisory_unlock", {"key": self.lock_key})
+
+    def lock_holder(self):
+        """
+        Return the process id of the server session holding the migration
+        lock, or None if the lock is free
+        """
+        key = self.lock_key & 0xFFFFFFFFFFFFFFFF
+        with self.transaction():
+            row = self.execute_statement(
+                "advisory_lock_holder",
+                {"classid": key >> 32, "objid": key & 0xFFFFFFFF},
+            ).fetchone()
+        return row[0] if row else None
+
+    def break_lock(self):
+        """
+        Clear any lock left in the lock table by older versions of yoyo.
+
+        Advisory locks are released when the session holding them ends, so
+        can't be broken from another session.
+
+        :raises LockHeld: if another session holds the lock
+        """
+        super(PostgresqlBackend, self).break_lock()
+        holder = self.lock_holder()
+        if holder is not None:
+            raise exceptions.LockHeld(
+                "The migration lock is held by PostgreSQL backend process "
+                "{0}. Stop the yoyo process holding it, or end the session "
+                "with 'SELECT pg_terminate_backend({0})'".format(holder)
+            )
+
     def init_connection(self, connection):
         if self.schema:
             cursor = connection.cursor()
@@ -0,0 +1,189 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk cache of parsed SQL migration files
+"""
+from logging import getLogger
+import hashlib
+import json
+import os
+import tempfile
+
+logger = getLogger("yoyo.migrations")
+
+#: Bumped whenever the layout of cache entries changes
+CACHE_FORMAT_VERSION = 1
+
+#: Default upper limit on the total size of the cache directory, in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class SQLMigrationCache(object):
+    """
+    Cache the result of parsing SQL migration files.
+
+    Entries are stored as one JSON file per migration file, keyed on the
+    migration file's absolute path. An entry is used without rereading the
+    migration if the file's size and modification time are unchanged, or
+    after rereading it if the sha256 digest of its content is unchanged.
+
+    Once the cache directory grows beyond ``max_size`` bytes the least
+    recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._total_size = None
+
+    def __repr__(self):
+        return "<{} {!r}>".format(self.__class__.__name__, self.directory)
+
+    def entry_path(self, path):
+        key = hashlib.sha256(os.path.abspath(path).encode("UTF-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    def read(self, path, parse, parser_id=""):
+        """
+        Return the parsed contents of the file at ``path``, either from the
+        cache or by calling ``parse`` with the file's text content.
+
+        :param parse: callable taking a str and returning a JSON
+                      serializable value
+        :param parser_id: a string identifying the parser. Entries created
+                          by a different parser are discarded.
+        """
+        st = os.stat(path)
+        entry_path = self.entry_path(path)
+        entry = self._load_entry(entry_path)
+        if entry is not None and entry.get("parser") != parser_id:
+            entry = None
+
+        if (
+            entry is not None
+            and entry["size"] == st.st_size
+            and entry["mtime"] == st.st_mtime_ns
+        ):
+            self._touch(entry_path)
+            return entry["data"]
+
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        if entry is not None and entry["digest"] == digest:
+            data = entry["data"]
+        else:
+            data = parse(content.decode("UTF-8"))
+
+        self._save_entry(
+            entry_path,
+            {
+                "version": CACHE_FORMAT_VERSION,
+                "parser": parser_id,
+                "path": os.path.abspath(path),
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "digest": digest,
+                "data": data,
+            },
+        )
+        return data
+
+    def _load_entry(self, entry_path):
+        try:
+            with open(entry_path, "r", encoding="UTF-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.debug("Discarding unreadable cache entry %r", entry_path)
+            return None
+        if entry.get("version") != CACHE_FORMAT_VERSION:
+            return None
+        return entry
+
+    def _touch(self, entry_path):
+        """
+        Update the entry's modification time, so that eviction happens in
+        least recently used order
+        """
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+    def _save_entry(self, entry_path, entry):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                dir=self.directory, prefix=".tmp", suffix=".json"
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                    json.dump(entry, f)
+                try:
+                    previous_size = os.stat(entry_path).st_size
+                except FileNotFoundError:
+                    previous_size = 0
+                os.replace(tmp, entry_path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            size = os.stat(entry_path).st_size
+        except OSError as e:
+            logger.warning("Could not write cache entry %r: %s", entry_path, e)
+            return
+
+        if self._total_size is None:
+            self._total_size = self._directory_size()
+        else:
+            self._total_size += size - previous_size
+        if self._total_size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if item.name.endswith(".json") and item.is_file():
+                        yield item
+        except FileNotFoundError:
+            return
+
+    def _directory_size(self):
+        return sum(item.stat().st_size for item in self._entries())
+
+    def evict(self, max_size=None):
+        """
+        Remove least recently used entries until the total size of the
+        cache is no more than ``max_size`` bytes.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = sorted(
+            ((item.stat(), item.path) for item in self._entries()),
+            key=lambda e: e[0].st_mtime_ns,
+        )
+        total = sum(st.st_size for st, _ in entries)
+        for st, entry_path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.unlink(entry_path)
+            except OSError:
+                continue
+            total -= st.st_size
+        self._total_size = total
@@ -35,3 +35,18 @@ class LockTimeout(Exception):
     """
     Timeout was reached while acquiring the migration lock
     """
+
+
+class LockHeld(Exception):
+    """
+    The migration lock is held by another database session, and can't be
+    broken without ending that session
+    """
+
+
+class SingleTransactionUnavailable(Exception):
+    """
+    Migrations could not be applied in a single transaction, either because
+    the database does not support transactional DDL or because a migration
+    is not transactional
+    """
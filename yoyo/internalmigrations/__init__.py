@@ -42,8 +42,8 @@ def get_current_version(backend):
     """
     Return the currently installed yoyo migrations schema version
     """
-    tables = set(backend.list_tables())
     version_table = backend.version_table
+    tables = backend.tables_exist([backend.migration_table, version_table])
     if backend.migration_table not in tables:
         return 0
     if version_table not in tables:
@@ -15,51 +15,67 @@
 from collections import Counter
 from collections import OrderedDict
 from collections import defaultdict
-from collections import deque
 from collections.abc import Iterable
 from collections.abc import MutableSequence
+from contextlib import nullcontext
 from copy import copy
 from glob import glob
 from itertools import chain
 from itertools import count
-from itertools import zip_longest
+from logging import DEBUG
 from logging import getLogger
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Tuple
+import ast
+import contextvars
 import hashlib
 import importlib.util
 import os
 import re
 import sys
 import inspect
+import pathlib
 import types
 import textwrap
 import weakref
 
-import pkg_resources
-import sqlparse
-
 from yoyo import exceptions
+from yoyo.cache import DEFAULT_MAX_SIZE
+from yoyo.cache import SQLMigrationCache
+from yoyo.output import open_output
+from yoyo.output import write_results
 from yoyo.utils import plural
 
 logger = getLogger("yoyo.migrations")
 default_migration_table = "_yoyo_migration"
 
+#: Filename prefix for migrations still being edited by ``yoyo new``
+tempfile_prefix = "_tmp_yoyonew"
+
 hash_function = hashlib.sha256
 
+#: SQL migrations larger than this (in bytes) are not loaded into memory.
+#: Their statements are read from the file one at a time as they are run.
+STREAM_SQL_THRESHOLD = 16 * 1024 * 1024
+
 _collectors = weakref.WeakValueDictionary()
 
+#: The StepCollector for the migration currently being loaded
+_current_collector = contextvars.ContextVar(
+    "_current_collector", default=None
+)
+
 
 def _is_migration_file(path):
     """
     Return True if the given path matches a migration file pattern
     """
-    from yoyo.scripts import newmigration
-
     _, extension = os.path.splitext(path)
     return extension in {".py", ".sql"} and not path.startswith(
-        newmigration.tempfile_prefix
+        tempfile_prefix
     )
 
 
@@ -84,31 +100,33 @@ LeadingCommentType = str
 SqlType = str
 
 
+_directive_names = ["transactional", "depends"]
+_comment_or_empty = re.compile(r"^(\s*|\s*--.*)$").match
+_directive_pattern = re.compile(
+    r"^\s*--\s*({})\s*:\s*(.*)$".format(
+        "|".join(map(re.escape, _directive_names))
+    )
+)
+_lineending = re.compile(r"\n|\r\n|\r")
+
+
 def parse_metadata_from_sql_comments(
     s: str,
 ) -> Tuple[DirectivesType, LeadingCommentType, SqlType]:
-    directive_names = ["transactional", "depends"]
-    comment_or_empty = re.compile(r"^(\s*|\s*--.*)$").match
-    directive_pattern = re.compile(
-        r"^\s*--\s*({})\s*:\s*(.*)$".format(
-            "|".join(map(re.escape, directive_names))
-        )
-    )
-
-    lineending = re.search(r"\n|\r\n|\r", s + "\n").group(0)
+    lineending = _lineending.search(s + "\n").group(0)
     lines = iter(s.split(lineending))
     directives = {}
     leading_comments = []
     sql = []
     for line in lines:
-        match = directive_pattern.match(line)
+        match = _directive_pattern.match(line)
         if match:
             k, v = match.groups()
             if k in directives:
                 directives[k] += " {}".format(v)
             else:
                 directives[k] = v
-        elif comment_or_empty(line):
+        elif _comment_or_empty(line):
             decommented = line.strip().lstrip("--").strip()
             leading_comments.append(decommented)
         else:
@@ -122,37 +140,213 @@ def parse_metadata_from_sql_comments(
     )
 
 
-def read_sql_migration(
-    path: str,
+def split_sql(s: str, dialect: Optional[str] = None) -> List[str]:
+    """
+    Split ``s`` into statements.
+
+    :param dialect: the name of one of the statement splitters in
+                    :data:`yoyo.sqlsplit.DIALECTS`, or ``None`` to split
+                    with ``sqlparse``
+    """
+    if dialect is None:
+        import sqlparse
+
+        return sqlparse.split(s)
+
+    from yoyo import sqlsplit
+
+    return sqlsplit.split(s, dialect)
+
+
+def parse_sql_migration(
+    s: str, dialect: Optional[str] = None
 ) -> Tuple[DirectivesType, LeadingCommentType, List[str]]:
     directives = {}
     leading_comment = ""
-    statements = []
-    if os.path.exists(path):
-        with open(path, "r", encoding="UTF-8") as f:
-            statements = sqlparse.split(f.read())
-            if statements:
-                (
-                    directives,
-                    leading_comment,
-                    sql,
-                ) = parse_metadata_from_sql_comments(statements[0])
-                statements[0] = sql
+    statements = split_sql(s, dialect)
+    if statements:
+        (
+            directives,
+            leading_comment,
+            sql,
+        ) = parse_metadata_from_sql_comments(statements[0])
+        statements[0] = sql
     statements = [s for s in statements if s.strip()]
     return directives, leading_comment, statements
 
 
+def read_sql_migration(
+    path: str,
+    cache: Optional[SQLMigrationCache] = None,
+    dialect: Optional[str] = None,
+) -> Tuple[DirectivesType, LeadingCommentType, List[str]]:
+    """
+    Read and parse the SQL migration file at ``path``.
+
+    :param cache: an optional :class:`~yoyo.cache.SQLMigrationCache`, used
+                  to avoid reparsing files that have not changed
+    :param dialect: the statement splitter to use (see :func:`split_sql`)
+    """
+    if not os.path.exists(path):
+        return {}, "", []
+    if cache is not None:
+        if dialect is None:
+            import sqlparse
+
+            parser_id = "sqlparse-{}".format(sqlparse.__version__)
+        else:
+            from yoyo import sqlsplit
+
+            parser_id = "sqlsplit-{}-{}".format(dialect, sqlsplit.VERSION)
+        directives, leading_comment, statements = cache.read(
+            path,
+            lambda s: parse_sql_migration(s, dialect),
+            parser_id=parser_id,
+        )
+        return directives, leading_comment, statements
+    with open(path, "r", encoding="UTF-8") as f:
+        return parse_sql_migration(f.read(), dialect)
+
+
+def read_sql_header(
+    path: str, dialect: Optional[str] = None
+) -> Tuple[DirectivesType, LeadingCommentType]:
+    """
+    Read the directives and leading comment from the SQL migration at
+    ``path``, without reading the rest of the file.
+    """
+    from yoyo import sqlsplit
+
+    with open(path, "r", encoding="UTF-8") as f:
+        first = next(
+            sqlsplit.iter_statements(f, dialect=dialect or "generic"), ""
+        )
+    directives, leading_comment, _ = parse_metadata_from_sql_comments(first)
+    return directives, leading_comment
+
+
+def iter_sql_migration(
+    path: str, dialect: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Yield the statements of the SQL migration at ``path`` one at a time, as
+    they are read from the file.
+
+    :param dialect: the name of one of the statement splitters in
+                    :data:`yoyo.sqlsplit.DIALECTS`. ``None`` uses the
+                    generic splitter, which splits like ``sqlparse``.
+    """
+    from yoyo import sqlsplit
+
+    with open(path, "r", encoding="UTF-8") as f:
+        statements = sqlsplit.iter_statements(f, dialect=dialect or "generic")
+        for ix, statement in enumerate(statements):
+            if ix == 0:
+                _, _, statement = parse_metadata_from_sql_comments(statement)
+            if statement.strip():
+                yield statement
+
+
+#: Module level names that may be read from python migrations without
+#: executing them
+_metadata_names = {"__depends__", "__transactional__"}
+
+
+def read_python_metadata(
+    path: str, source: Optional[bytes] = None
+) -> Optional[Dict]:
+    """
+    Statically extract ``__depends__``, ``__transactional__`` and the
+    docstring from the python migration file at ``path``.
+
+    Return ``None`` if the migration can't be parsed, or if these names
+    are assigned anything other than literal values at the top level of
+    the module. In these cases the module must be executed to find their
+    values.
+
+    :param source: the content of the file, if already read
+    """
+    if source is None:
+        with open(path, "rb") as f:
+            source = f.read()
+    try:
+        tree = ast.parse(source, path)
+    except (SyntaxError, ValueError):
+        return None
+
+    values = {}
+    toplevel = set()
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and any(
+            alias.name == "*" for alias in node.names
+        ):
+            return None
+        if isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = (
+                node.targets if isinstance(node, ast.Assign) else [node.target]
+            )
+            names = [t.id for t in targets if isinstance(t, ast.Name)]
+            if not _metadata_names.intersection(names):
+                continue
+            if len(names) != len(targets) or node.value is None:
+                return None
+            try:
+                value = ast.literal_eval(node.value)
+            except (ValueError, TypeError):
+                return None
+            values.update((name, value) for name in names)
+            toplevel.update(targets)
+
+    # Any other binding of these names (eg inside a conditional block, an
+    # augmented assignment or an import) can't be evaluated statically
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Name)
+            and node.id in _metadata_names
+            and isinstance(node.ctx, (ast.Store, ast.Del))
+            and node not in toplevel
+        ):
+            return None
+        if (
+            isinstance(node, ast.alias)
+            and (node.asname or node.name) in _metadata_names
+        ):
+            return None
+
+    return {
+        "depends": values.get("__depends__", []),
+        "transactional": values.get("__transactional__", True),
+        # Not cleaned, to match the module's __doc__ once loaded
+        "doc": ast.get_docstring(tree, clean=False),
+    }
+
+
 class Migration(object):
+    """
+    :param resource_dir: for migrations in a package that is not installed
+                         as plain files (eg a zipped package), the
+                         ``importlib.resources`` traversable containing the
+                         migration. Files are read through this rather than
+                         opened by ``path``.
+    """
 
     __all_migrations = {}
 
-    def __init__(self, id, path):
+    def __init__(
+        self, id, path, cache=None, sql_dialect=None, resource_dir=None
+    ):
         self.id = id
         self.hash = get_migration_hash(id)
         self.path = path
+        self.cache = cache
+        self.sql_dialect = sql_dialect
+        self.resource_dir = resource_dir
         self.steps = None
         self.use_transactions = True
+        self.doc = None
         self._depends = None
+        self._sql = None
+        self.rollback_statements = None
         self.__all_migrations[id] = self
         self.module = None
 
@@ -170,16 +364,50 @@ class Migration(object):
 
     @property
     def depends(self):
-        self.load()
+        self.load_metadata()
         return self._depends
 
+    def load_metadata(self):
+        """
+        Load the migration's dependencies and transactional setting.
+
+        Python migrations that declare these as literal values are not
+        executed. Otherwise the migration is fully loaded.
+        """
+        if self._depends is not None:
+            return
+        if self.is_raw_sql():
+            return self.load()
+        if self.resource_dir is None:
+            metadata = read_python_metadata(self.path)
+        else:
+            metadata = read_python_metadata(self.path, self._read_resource())
+        if metadata is None:
+            return self.load()
+        self._set_metadata(
+            metadata["depends"], metadata["transactional"], metadata["doc"]
+        )
+
+    def _set_metadata(self, depends, transactional, doc):
+        if isinstance(depends, (str, bytes)):
+            depends = [depends]
+        resolved = {self.__all_migrations.get(id, None) for id in depends}
+        if None in resolved:
+            raise exceptions.BadMigration(
+                "Could not resolve dependencies in {}".format(self.path)
+            )
+        self._depends = resolved
+        self.use_transactions = transactional
+        self.doc = doc
+
     def load(self):
         if self.loaded:
             return
 
         collector = _collectors[self.path] = StepCollector(migration=self)
-        if self.is_raw_sql():
+        if self.is_raw_sql() or self.resource_dir is not None:
             self.module = types.ModuleType(self.path)
+            self.module.__file__ = self.path
         else:
             spec = importlib.util.spec_from_file_location(self.path, self.path)
             self.module = importlib.util.module_from_spec(spec)
@@ -189,19 +417,28 @@ class Migration(object):
         self.module.transaction = collector.add_step_group
         self.module.collector = collector
         if self.is_raw_sql():
-            directives, leading_comment, statements = read_sql_migration(
-                self.path
-            )
-            _, _, rollback_statements = read_sql_migration(
-                os.path.splitext(self.path)[0] + ".rollback.sql"
-            )
-            rollback_statements.reverse()
-            statements_with_rollback = zip_longest(
-                statements, rollback_statements, fillvalue=None
-            )
-
-            for s, r in statements_with_rollback:
-                self.module.collector.add_step(s, r)
+            rollback_path = os.path.splitext(self.path)[0] + ".rollback.sql"
+            if self.resource_dir is not None:
+                self._sql = parse_sql_migration(
+                    self._read_resource().decode("UTF-8"), self.sql_dialect
+                )
+                self.rollback_statements = SQLRollbackStatements(
+                    rollback_path,
+                    sql_dialect=self.sql_dialect,
+                    resource=self.resource_dir.joinpath(
+                        os.path.basename(rollback_path)
+                    ),
+                )
+            else:
+                self.rollback_statements = SQLRollbackStatements(
+                    rollback_path, self.cache, self.sql_dialect
+                )
+            if self._sql is None:
+                self._sql = _read_sql_migration(
+                    self.path, self.cache, self.sql_dialect
+                )
+            directives, leading_comment, statements = self._sql
+            self._sql = None
             self.module.__doc__ = leading_comment
             self.module.__transactional__ = {"true": True, "false": False}[
                 directives.get("transactional", "true").lower()
@@ -211,24 +448,69 @@ class Migration(object):
             }
 
         else:
+            token = _current_collector.set(collector)
             try:
-                spec.loader.exec_module(self.module)
+                if self.resource_dir is None:
+                    spec.loader.exec_module(self.module)
+                else:
+                    code = compile(self._read_resource(), self.path, "exec")
+                    exec(code, self.module.__dict__)
 
             except Exception as e:
                 logger.exception(
                     "Could not import migration from %r: %r", self.path, e
                 )
                 raise exceptions.BadMigration(self.path, e)
-        depends = getattr(self.module, "__depends__", [])
-        if isinstance(depends, (str, bytes)):
-            depends = [depends]
-        self._depends = {self.__all_migrations.get(id, None) for id in depends}
-        self.use_transactions = getattr(self.module, "__transactional__", True)
-        if None in self._depends:
-            raise exceptions.BadMigration(
-                "Could not resolve dependencies in {}".format(self.path)
+            finally:
+                _current_collector.reset(token)
+        self._set_metadata(
+            getattr(self.module, "__depends__", []),
+            getattr(self.module, "__transactional__", True),
+            self.module.__doc__,
+        )
+        if not self.is_raw_sql():
+            self.steps = collector.create_steps(self.use_transactions)
+        elif statements is None:
+            self.steps = StreamingSQLSteps(
+                self.path,
+                self.rollback_statements,
+                self.use_transactions,
+                self.sql_dialect,
             )
-        self.steps = collector.create_steps(self.use_transactions)
+        else:
+            self.steps = [
+                self._sql_step(ix, s) for ix, s in enumerate(statements)
+            ]
+
+    def _read_resource(self):
+        """
+        Return the content of the migration file from :attr:`resource_dir`
+        """
+        resource = self.resource_dir.joinpath(os.path.basename(self.path))
+        return resource.read_bytes()
+
+    def _sql_step(self, ix, statement):
+        wrapper = (
+            TransactionWrapper if self.use_transactions else Transactionless
+        )
+        return wrapper(
+            SQLMigrationStep(ix, statement, self.rollback_statements)
+        )
+
+    def load_rollback(self):
+        """
+        Read the statements of an SQL migration's ``.rollback.sql`` file.
+        Any rollback statements without a corresponding apply statement are
+        added as steps of their own.
+
+        This is only needed before iterating over the steps to roll them
+        back: otherwise rollback statements are read when first used.
+        """
+        self.load()
+        if not self.is_raw_sql() or not isinstance(self.steps, list):
+            return
+        for ix in range(len(self.steps), len(self.rollback_statements)):
+            self.steps.append(self._sql_step(ix, None))
 
     def process_steps(self, backend, direction, force=False):
 
@@ -237,26 +519,45 @@ class Migration(object):
 
         steps = self.steps
         if direction == "rollback":
+            self.load_rollback()
             steps = reversed(steps)
 
+        # Without transactional DDL, steps that have already run must be
+        # reversed individually if a later step fails
+        compensate = (
+            not self.use_transactions or not backend.has_transactional_ddl
+        )
         executed_steps = []
-        if self.use_transactions:
-            transaction = backend.transaction
-        else:
+        if not self.use_transactions:
             transaction = backend.disable_transactions
+        elif backend._in_transaction:
+            # Run within the caller's transaction
+            transaction = nullcontext
+        else:
+            transaction = backend.transaction
+
+        if (
+            self.use_transactions
+            and isinstance(self.steps, list)
+            and logger.isEnabledFor(DEBUG)
+        ):
+            avoided = _count_savepoints_avoided(self.steps, direction, force)
+            logger.debug(
+                "Running %s with %s avoided",
+                self.id,
+                plural(avoided, "%d savepoint", "%d savepoints"),
+            )
 
         with transaction():
             for step in steps:
                 try:
                     getattr(step, direction)(backend, force)
-                    executed_steps.append(step)
+                    if compensate:
+                        executed_steps.append(step)
                 except backend.DatabaseError:
                     exc_info = sys.exc_info()
 
-                    if (
-                        not backend.has_transactional_ddl
-                        or not self.use_transactions
-                    ):
+                    if compensate:
                         # Any DDL statements that have been executed have been
                         # committed. Go through the rollback steps to undo
                         # these inasmuch is possible.
@@ -270,6 +571,24 @@ class Migration(object):
                     raise exc_info[1].with_traceback(exc_info[2])
 
 
+def _count_savepoints_avoided(steps, direction, force):
+    """
+    Return the number of steps in ``steps`` (including steps nested in
+    groups) that can run without a savepoint
+    """
+    avoided = 0
+    for step in steps:
+        if not isinstance(step, TransactionWrapper):
+            continue
+        if not step.needs_savepoint(direction, force):
+            avoided += 1
+        if isinstance(step.step, StepGroup):
+            avoided += _count_savepoints_avoided(
+                step.step.steps, direction, force
+            )
+    return avoided
+
+
 class PostApplyHookMigration(Migration):
     """
     A special migration that is run after successfully applying a set of
@@ -307,7 +626,21 @@ class TransactionWrapper(StepBase):
     def __repr__(self):
         return "<TransactionWrapper {!r}>".format(self.step)
 
+    def needs_savepoint(self, direction, force=False):
+        """
+        Return True if the step must be run in its own transaction or
+        savepoint, so that errors can be rolled back and ignored.
+        Otherwise any error aborts the enclosing transaction, and the step
+        can be run directly within it.
+        """
+        return force or self.ignore_errors in (direction, "all")
+
     def apply(self, backend, force=False, direction="apply"):
+        if backend._in_transaction and not self.needs_savepoint(
+            direction, force
+        ):
+            getattr(self.step, direction)(backend, force)
+            return
         with backend.transaction() as transaction:
             try:
                 getattr(self.step, direction)(backend, force)
@@ -365,38 +698,47 @@ class MigrationStep(StepBase):
         self._rollback = rollback
         self._apply = apply
 
-    def _execute(self, cursor, stmt, out=None):
+    def _execute(
+        self,
+        cursor,
+        stmt,
+        output_file=None,
+        output_mode="table",
+        max_rows=None,
+    ):
         """
-        Execute the given statement. If rows are returned, output these in a
-        tabulated format.
+        Execute the given statement. If rows are returned, output these in
+        the format given by ``output_mode``
+        (see :func:`yoyo.output.write_results`).
+
+        :param output_file: the path of a file to append rows to, or
+                            ``None`` to write to stdout. This is only
+                            opened if the statement returns rows.
         """
-        if out is None:
-            out = sys.stdout
         if isinstance(stmt, str):
             logger.debug(" - executing %r", stmt.encode("ascii", "replace"))
         else:
             logger.debug(" - executing %r", stmt)
         cursor.execute(stmt)
-        if cursor.description:
-            result = [
-                [str(value) for value in row] for row in cursor.fetchall()
-            ]
-            column_names = [desc[0] for desc in cursor.description]
-            column_sizes = [len(c) for c in column_names]
-
-            for row in result:
-                for ix, value in enumerate(row):
-                    if len(value) > column_sizes[ix]:
-                        column_sizes[ix] = len(value)
-            format = "|".join(" %%- %ds " % size for size in column_sizes)
-            format += "\n"
-            out.write(format % tuple(column_names))
-            out.write(
-                "+".join("-" * (size + 2) for size in column_sizes) + "\n"
+        if cursor.description and output_mode != "none":
+            with open_output(output_file) as out:
+                write_results(cursor, out, output_mode, max_rows)
+
+    def _run(self, backend, stmt):
+        if not isinstance(stmt, str):
+            stmt(backend.connection)
+            return
+        cursor = backend.cursor()
+        try:
+            self._execute(
+                cursor,
+                stmt,
+                backend.output_file,
+                output_mode=backend.output_mode,
+                max_rows=backend.output_max_rows,
             )
-            for row in result:
-                out.write(format % tuple(row))
-            out.write(plural(len(result), "(%d row)", "(%d rows)") + "\n")
+        finally:
+            cursor.close()
 
     def apply(self, backend, force=False):
         """
@@ -407,14 +749,7 @@ class MigrationStep(StepBase):
         logger.info(" - applying step %d", self.id)
         if not self._apply:
             return
-        if isinstance(self._apply, str):
-            cursor = backend.cursor()
-            try:
-                self._execute(cursor, self._apply)
-            finally:
-                cursor.close()
-        else:
-            self._apply(backend.connection)
+        self._run(backend, self._apply)
 
     def rollback(self, backend, force=False):
         """
@@ -423,14 +758,7 @@ class MigrationStep(StepBase):
         logger.info(" - rolling back step %d", self.id)
         if self._rollback is None:
             return
-        if isinstance(self._rollback, str):
-            cursor = backend.cursor()
-            try:
-                self._execute(cursor, self._rollback)
-            finally:
-                cursor.close()
-        else:
-            self._rollback(backend.connection)
+        self._run(backend, self._rollback)
 
 
 class StepGroup(MigrationStep):
@@ -453,34 +781,301 @@ class StepGroup(MigrationStep):
             item.rollback(backend, force)
 
 
-def read_migrations(*sources):
+class SQLMigrationStep(MigrationStep):
+    """
+    A step of an SQL migration. The rollback statement is looked up in the
+    migration's :class:`SQLRollbackStatements` when first needed.
+    """
+
+    def __init__(self, id, apply, rollback_statements):
+        self.id = id
+        self._apply = apply
+        self.rollback_statements = rollback_statements
+
+    @property
+    def _rollback(self):
+        return self.rollback_statements.get(self.id)
+
+
+class SQLRollbackStatements(object):
+    """
+    The statements of an SQL migration's ``.rollback.sql`` file, indexed by
+    the id of the step they roll back. The file is read on first access, so
+    that applying migrations does not need to read it.
+
+    :param resource: if given, an ``importlib.resources`` traversable from
+                     which the file is read in place of ``path``
+    """
+
+    def __init__(self, path, cache=None, sql_dialect=None, resource=None):
+        self.path = path
+        self.cache = cache
+        self.sql_dialect = sql_dialect
+        self.resource = resource
+        self._statements = None
+
+    def __repr__(self):
+        return "<{} from {}>".format(self.__class__.__name__, self.path)
+
+    @property
+    def loaded(self):
+        return self._statements is not None
+
+    def load(self):
+        if self._statements is None:
+            if self.resource is None:
+                _, _, statements = read_sql_migration(
+                    self.path, self.cache, self.sql_dialect
+                )
+            elif self.resource.is_file():
+                _, _, statements = parse_sql_migration(
+                    self.resource.read_text(encoding="UTF-8"),
+                    self.sql_dialect,
+                )
+            else:
+                statements = []
+            # The last rollback statement reverses the first step
+            self._statements = statements[::-1]
+        return self._statements
+
+    def __len__(self):
+        return len(self.load())
+
+    def get(self, ix):
+        """
+        Return the rollback statement for step ``ix``, or None
+        """
+        statements = self.load()
+        if ix < len(statements):
+            return statements[ix]
+        return None
+
+
+class StreamingSQLSteps(object):
+    """
+    The steps of an SQL migration too large to load into memory (see
+    :data:`STREAM_SQL_THRESHOLD`). Statements are read from the file each
+    time the steps are iterated.
+    """
+
+    def __init__(
+        self, path, rollback_statements, use_transactions, sql_dialect=None
+    ):
+        self.path = path
+        self.rollback_statements = rollback_statements
+        self.use_transactions = use_transactions
+        self.sql_dialect = sql_dialect
+
+    def __repr__(self):
+        return "<{} from {}>".format(self.__class__.__name__, self.path)
+
+    def __iter__(self):
+        wrapper = (
+            TransactionWrapper if self.use_transactions else Transactionless
+        )
+        rollbacks = self.rollback_statements
+        ix = -1
+        statements = iter_sql_migration(self.path, self.sql_dialect)
+        for ix, s in enumerate(statements):
+            yield wrapper(SQLMigrationStep(ix, s, rollbacks))
+        if rollbacks.loaded:
+            for ix in range(ix + 1, len(rollbacks)):
+                yield wrapper(SQLMigrationStep(ix, None, rollbacks))
+
+    def __reversed__(self):
+        # Rolling back pairs each rollback statement with its apply
+        # statement, so the full list is needed
+        self.rollback_statements.load()
+        return reversed(list(self))
+
+
+def _read_sql_migration(path, cache=None, sql_dialect=None):
+    """
+    Read the SQL migration at ``path``. Its ``.rollback.sql`` file is not
+    read (see :class:`SQLRollbackStatements`).
+
+    Migrations larger than :data:`STREAM_SQL_THRESHOLD` are not parsed:
+    only their directives and leading comment are read, and ``None`` is
+    returned in place of the list of statements.
+    """
+    if os.path.exists(path) and os.path.getsize(path) > STREAM_SQL_THRESHOLD:
+        return read_sql_header(path, sql_dialect) + (None,)
+    return read_sql_migration(path, cache, sql_dialect)
+
+
+def _read_migration_metadata(path, cache=None, sql_dialect=None):
+    """
+    Read the migration file at ``path`` without executing it. This runs in
+    a worker process, so only returns picklable values.
+    """
+    if path.endswith(".sql"):
+        return _read_sql_migration(path, cache, sql_dialect)
+    return read_python_metadata(path)
+
+
+def load_migration_metadata(migrations, jobs=None):
+    """
+    Load the dependencies and metadata of all ``migrations``, reading and
+    parsing files in a pool of ``jobs`` worker processes.
+
+    Python migrations whose metadata can't be read statically are loaded
+    in the current process once all workers have finished.
+
+    All errors are collected and raised together as a single
+    :class:`~yoyo.exceptions.BadMigration`.
+
+    :param jobs: the number of worker processes, or ``None`` to use one
+                 per CPU
+    """
+    migrations = [
+        m
+        for m in chain(migrations, getattr(migrations, "post_apply", []))
+        if m._depends is None
+    ]
+    if not migrations:
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(
+                _read_migration_metadata,
+                m.path,
+                m.cache,
+                m.sql_dialect,
+            )
+            if m.resource_dir is None
+            else None
+            for m in migrations
+        ]
+
+    errors = []
+    for m, future in zip(migrations, futures):
+        try:
+            if future is None:
+                # Migrations that are not plain files are read in this
+                # process
+                m.load_metadata()
+                continue
+            result = future.result()
+            if m.is_raw_sql():
+                m._sql = result
+                m.load()
+            elif result is None:
+                m.load()
+            else:
+                m._set_metadata(
+                    result["depends"], result["transactional"], result["doc"]
+                )
+        except exceptions.BadMigration as e:
+            errors.append("{}: {}".format(m.path, e.args[-1]))
+        except Exception as e:
+            errors.append("{}: {!r}".format(m.path, e))
+    if errors:
+        raise exceptions.BadMigration(
+            "Could not load {}:\n{}".format(
+                plural(len(errors), "%d migration", "%d migrations"),
+                "\n".join(errors),
+            )
+        )
+
+
+def _list_package_migrations(package_name, resource_dir):
+    """
+    Find the migrations in directory ``resource_dir`` of package
+    ``package_name``.
+
+    :return: a dict mapping the path of each migration to ``None`` if it is
+             a plain file, or otherwise to the ``importlib.resources``
+             traversable from which it must be read (eg for packages
+             imported from a zip file)
+    """
+    try:
+        from importlib.resources import files
+    except ImportError:  # Python < 3.9
+        from importlib_resources import files
+
+    directory = files(package_name)
+    for part in resource_dir.split("/"):
+        if part:
+            directory = directory.joinpath(part)
+    return {
+        str(item): None if isinstance(item, pathlib.Path) else directory
+        for item in directory.iterdir()
+        if _is_migration_file(item.name)
+    }
+
+
+def read_migrations(
+    *sources,
+    cache_dir=None,
+    cache_max_size=None,
+    jobs=None,
+    sql_dialect=None
+):
     """
     Return a ``MigrationList`` containing all migrations from ``directory``.
+
+    :param cache_dir: if given, parsed SQL migrations will be cached in
+                      this directory
+    :param cache_max_size: the size in bytes beyond which the least
+                           recently used entries are removed from
+                           ``cache_dir`` (default: 64MB)
+    :param jobs: if given, read all migration files up front in this many
+                 worker processes (see :func:`load_migration_metadata`).
+                 ``0`` uses one process per CPU.
+    :param sql_dialect: the statement splitter used for SQL migrations
+                        (see :func:`split_sql`), or a dict mapping sources
+                        to statement splitters. SQL migrations are split
+                        with ``sqlparse`` by default.
+    :raises ValueError: if ``jobs`` is negative, if ``sql_dialect`` names
+                        an unknown dialect, or is a dict with keys that
+                        are not in ``sources``
     """
+    if jobs is not None and jobs < 0:
+        raise ValueError("jobs must be 0 or more")
+    if isinstance(sql_dialect, dict):
+        dialects = sql_dialect
+        unmatched = set(dialects).difference(sources)
+        if unmatched:
+            raise ValueError(
+                "sql_dialect given for unknown sources: {}".format(
+                    ", ".join(sorted(map(repr, unmatched)))
+                )
+            )
+    else:
+        dialects = dict.fromkeys(sources, sql_dialect)
+    for dialect in dialects.values():
+        if dialect is None:
+            continue
+        from yoyo import sqlsplit
+
+        if dialect not in sqlsplit.DIALECTS:
+            raise ValueError("Unknown SQL dialect: {!r}".format(dialect))
+
     migrations = MigrationList()
+    if cache_max_size is None:
+        cache_max_size = DEFAULT_MAX_SIZE
+    cache = (
+        SQLMigrationCache(cache_dir, max_size=cache_max_size)
+        if cache_dir
+        else None
+    )
     for source in sources:
         package_match = re.match(r"^package:([^\s\/:]+):(.*)$", source)
 
         if package_match:
-            package_name = package_match.group(1)
-            resource_dir = package_match.group(2)
-            paths = [
-                pkg_resources.resource_filename(
-                    package_name, "{}/{}".format(resource_dir, f)
-                )
-                for f in pkg_resources.resource_listdir(
-                    package_name, resource_dir
-                )
-                if _is_migration_file(f)
-            ]
+            paths = _list_package_migrations(
+                package_match.group(1), package_match.group(2)
+            )
 
         else:
-            paths = [
+            paths = dict.fromkeys(
                 os.path.join(directory, path)
                 for directory in glob(source)
                 for path in os.listdir(directory)
                 if _is_migration_file(path)
-            ]
+            )
 
         for path in sorted(paths):
             if path.endswith(".rollback.sql"):
@@ -493,12 +1088,18 @@ def read_migrations(*sources):
                 migration_class = Migration
 
             migration = migration_class(
-                os.path.splitext(os.path.basename(path))[0], path
+                os.path.splitext(os.path.basename(path))[0],
+                path,
+                cache,
+                dialects.get(source),
+                paths[path],
             )
             if migration_class is PostApplyHookMigration:
                 migrations.post_apply.append(migration)
             else:
                 migrations.append(migration)
+    if jobs is not None and jobs != 1:
+        load_migration_metadata(migrations, jobs=jobs or None)
     return migrations
 
 
@@ -512,10 +1113,21 @@ class MigrationList(MutableSequence):
         self.post_apply = post_apply if post_apply else []
         self.keys = set(item.id for item in self.items)
         self.check_conflicts()
+        self._graph = None
 
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, repr(self.items))
 
+    @property
+    def graph(self):
+        """
+        The :class:`MigrationGraph` for this list. This is built on first
+        access and discarded when the list is modified.
+        """
+        if self._graph is None:
+            self._graph = MigrationGraph(self.items)
+        return self._graph
+
     def check_conflicts(self):
         c = Counter()
         for item in self:
@@ -543,6 +1155,7 @@ class MigrationList(MutableSequence):
 
         self.keys.difference_update(removing)
         self.keys.update(new_ids)
+        self._graph = None
         return self.items.__setitem__(n, ob)
 
     def __len__(self):
@@ -550,16 +1163,20 @@ class MigrationList(MutableSequence):
 
     def __delitem__(self, i):
         self.keys.remove(self.items[i].id)
+        self._graph = None
         self.items.__delitem__(i)
 
     def insert(self, i, x):
         if x.id in self.keys:
             raise exceptions.MigrationConflict(x.id)
         self.keys.add(x.id)
+        self._graph = None
         return self.items.insert(i, x)
 
     def __add__(self, other):
         ob = copy(self)
+        ob.items = list(self.items)
+        ob.keys = set(self.keys)
         ob.extend(other)
         return ob
 
@@ -641,6 +1258,11 @@ class StepCollector(object):
 
 
 def _get_collector(depth=2):
+    collector = _current_collector.get()
+    if collector is not None:
+        return collector
+
+    # Fall back to searching the stack for a migration module
     for stackframe in reversed(inspect.stack()):
         path = stackframe.frame.f_code.co_filename
         if path in _collectors:
@@ -663,6 +1285,254 @@ def group(*args, **kwargs):
 transaction = group
 
 
+class MigrationGraph(object):
+    """
+    The dependency graph of a collection of migrations.
+
+    Edges from each migration to the migrations that depend on it are
+    indexed on first use, and the results of :meth:`ancestors` and
+    :meth:`descendants` are memoized, so that repeated queries against the
+    same graph don't need to walk the dependencies again.
+    """
+
+    def __init__(self, migrations):
+        self.migrations = list(migrations)
+        self.population = set(self.migrations)
+        self._dependents = None
+        self._ancestors = {}
+        self._descendants = {}
+
+    def __repr__(self):
+        return "<{} ({} migrations)>".format(
+            self.__class__.__name__, len(self.migrations)
+        )
+
+    @property
+    def dependents(self):
+        """
+        Return a dict mapping each migration to the list of migrations in
+        the graph that directly depend on it
+        """
+        if self._dependents is None:
+            dependents = defaultdict(list)
+            for m in self.migrations:
+                for d in m.depends:
+                    dependents[d].append(m)
+            self._dependents = dependents
+        return self._dependents
+
+    def ancestors(self, migration):
+        """
+        Return the set of migrations that ``migration`` depends on, directly
+        or indirectly.
+        """
+        try:
+            return self._ancestors[migration]
+        except KeyError:
+            pass
+        result = self._ancestors[migration] = frozenset(
+            self._walk(migration, lambda m: m.depends)
+        )
+        return result
+
+    def descendants(self, migration):
+        """
+        Return the set of migrations in the graph that depend on
+        ``migration``, directly or indirectly.
+        """
+        try:
+            return self._descendants[migration]
+        except KeyError:
+            pass
+        dependents = self.dependents
+        result = self._descendants[migration] = frozenset(
+            self._walk(migration, lambda m: dependents.get(m, ()))
+        )
+        return result
+
+    def _walk(self, start, edges):
+        """
+        Return the set of nodes reachable from ``start``, excluding
+        ``start`` itself.
+        """
+        seen = set()
+        to_process = [start]
+        while to_process:
+            for n in edges(to_process.pop()):
+                if n not in seen:
+                    seen.add(n)
+                    to_process.append(n)
+        seen.discard(start)
+        return seen
+
+    def heads(self):
+        """
+        Return the set of migrations that no other migration depends on
+        """
+        dependents = self.dependents
+        return {m for m in self.migrations if not dependents.get(m)}
+
+    def topological_sort(self):
+        """
+        Return the migrations sorted so that every migration comes after
+        the migrations it depends on.
+
+        Migrations that take part in a dependency relationship are returned
+        first, in dependency order. Ties are broken by the original order
+        of the migrations, so the sort is stable and deterministic.
+        The remaining migrations follow in their original order.
+
+        :raises BadMigration: if there are circular dependencies
+        """
+        migrations = self.migrations
+        n = len(migrations)
+        index = {m: ix for ix, m in reversed(list(enumerate(migrations)))}
+
+        # Map migrations to dense integers and collect the edges (from
+        # each dependency to the migrations depending on it) in two
+        # parallel flat arrays. Dependents are visited in their original
+        # order, so the edges from each node are sorted by target.
+        sources = []
+        targets = []
+        for ix, m in enumerate(migrations):
+            for d in m.depends:
+                dix = index.get(d)
+                if dix is not None:
+                    sources.append(dix)
+                    targets.append(ix)
+
+        # Arrange the edges by source (a stable counting sort), so that
+        # the dependents of node i are
+        # edge_targets[offsets[i]:offsets[i + 1]]
+        indegree = [0] * n
+        in_graph = bytearray(n)
+        offsets = [0] * (n + 1)
+        for src, tgt in zip(sources, targets):
+            offsets[src + 1] += 1
+            indegree[tgt] += 1
+            in_graph[src] = in_graph[tgt] = 1
+        for ix in range(n):
+            offsets[ix + 1] += offsets[ix]
+        edge_targets = [0] * len(targets)
+        fill = offsets[:-1]
+        for src, tgt in zip(sources, targets):
+            edge_targets[fill[src]] = tgt
+            fill[src] += 1
+        del sources, targets, fill
+
+        # Kahn's algorithm. ``order`` doubles as a FIFO queue of nodes whose
+        # dependencies have all been sorted.
+        order = [ix for ix in range(n) if in_graph[ix] and not indegree[ix]]
+        pos = 0
+        while pos < len(order):
+            ix = order[pos]
+            pos += 1
+            for e in range(offsets[ix], offsets[ix + 1]):
+                tgt = edge_targets[e]
+                indegree[tgt] -= 1
+                if not indegree[tgt]:
+                    order.append(tgt)
+
+        if len(order) < sum(in_graph):
+            unsorted = [ix for ix in range(n) if indegree[ix]]
+            cycles = find_cycles(unsorted, offsets, edge_targets)
+            raise exceptions.BadMigration(
+                "Circular dependencies among these migrations: {}".format(
+                    "; ".join(
+                        ", ".join(migrations[ix].id for ix in cycle)
+                        for cycle in cycles
+                    )
+                )
+            )
+
+        # Return the toposorted migrations followed by the remainder of
+        # migrations in their original order
+        return [migrations[ix] for ix in order] + [
+            m for ix, m in enumerate(migrations) if not in_graph[index[m]]
+        ]
+
+
+def find_cycles(nodes, offsets, edge_targets):
+    """
+    Return the strongly connected components among ``nodes`` that contain
+    a cycle, using Tarjan's algorithm.
+
+    Edges are given in compressed form: the successors of node i are
+    ``edge_targets[offsets[i]:offsets[i + 1]]``. Only edges between members
+    of ``nodes`` are followed.
+
+    Each component is returned as a sorted list of nodes, and the
+    components are ordered by their lowest numbered node.
+    """
+    n = len(offsets) - 1
+    included = bytearray(n)
+    for v in nodes:
+        included[v] = 1
+    index_of = [-1] * n
+    lowlink = [0] * n
+    on_stack = bytearray(n)
+    stack = []
+    components = []
+    counter = 0
+
+    for root in nodes:
+        if index_of[root] != -1:
+            continue
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, offsets[root])]
+        while work:
+            v, e = work[-1]
+            end = offsets[v + 1]
+            while e < end:
+                w = edge_targets[e]
+                e += 1
+                if not included[w]:
+                    continue
+                if index_of[w] == -1:
+                    work[-1] = (v, e)
+                    index_of[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    work.append((w, offsets[w]))
+                    break
+                elif on_stack[w] and index_of[w] < lowlink[v]:
+                    lowlink[v] = index_of[w]
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if lowlink[v] < lowlink[u]:
+                        lowlink[u] = lowlink[v]
+                if lowlink[v] == index_of[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    if len(component) > 1 or v in edge_targets[
+                        offsets[v] : offsets[v + 1]
+                    ]:
+                        components.append(sorted(component))
+
+    return sorted(components)
+
+
+def get_graph(migrations):
+    """
+    Return a :class:`MigrationGraph` for ``migrations``, reusing the graph
+    cached on :class:`MigrationList` objects.
+    """
+    if isinstance(migrations, MigrationList):
+        return migrations.graph
+    return MigrationGraph(migrations)
+
+
 def ancestors(migration, population):
     """
     Return the dependencies for ``migration`` from ``population``.
@@ -670,20 +1540,7 @@ def ancestors(migration, population):
     :param migration: a :class:`~yoyo.migrations.Migration` object
     :param population: a collection of migrations
     """
-    to_process = set()
-    for m in migration.depends:
-        to_process.add(m)
-
-    deps = set()
-    while to_process:
-        m = to_process.pop()
-        deps.add(m)
-        for d in m.depends:
-            if d in deps:
-                continue
-            deps.add(d)
-            to_process.add(d)
-    return deps
+    return set(get_graph(population).ancestors(migration))
 
 
 def descendants(migration, population):
@@ -693,90 +1550,15 @@ def descendants(migration, population):
     :param migration: a :class:`~yoyo.migrations.Migration` object
     :param population: a collection of migrations
     """
-    population = set(population)
-    descendants = {migration}
-    while True:
-        found = False
-        for m in population - descendants:
-            if set(m.depends) & descendants:
-                descendants.add(m)
-                found = True
-        if not found:
-            break
-    descendants.remove(migration)
-    return descendants
+    return set(get_graph(population).descendants(migration))
 
 
 def heads(migration_list):
     """
     Return the set of migrations that have no child dependencies
     """
-    heads = set(migration_list)
-    for m in migration_list:
-        heads -= m.depends
-    return heads
+    return get_graph(migration_list).heads()
 
 
 def topological_sort(migration_list):
-
-    # The sorted list, initially empty
-    L = list()
-
-    # Make a copy of migration_list. It's probably an iterator.
-    migration_list = list(migration_list)
-    valid_migrations = set(migration_list)
-
-    # Track graph edges in two parallel data structures.
-    # Use OrderedDict so that we can traverse edges in order
-    # and keep the sort stable
-    forward_edges = defaultdict(OrderedDict)
-    backward_edges = defaultdict(OrderedDict)
-
-    for m in migration_list:
-        for n in m.depends:
-            if n not in valid_migrations:
-                continue
-            forward_edges[n][m] = 1
-            backward_edges[m][n] = 1
-
-    # Only toposort the migrations forming part of the dependency graph
-    to_toposort = set(chain(forward_edges, backward_edges))
-
-    # Starting migrations: those with no dependencies
-    # To make this a stable sort we always need to pop from the left end
-    # of this list, hence use a deque.
-    S = deque(
-        m
-        for m in to_toposort
-        if not any(n in valid_migrations for n in m.depends)
-    )
-
-    while S:
-        n = S.popleft()
-        L.append(n)
-
-        # for each node M with an edge E from N to M
-        for m in list(forward_edges[n]):
-
-            # remove edge E from the graph
-            del forward_edges[n][m]
-            del backward_edges[m][n]
-
-            # If M has no other incoming edges, it qualifies as a starting node
-            if not backward_edges[m]:
-                S.append(m)
-
-    if any(forward_edges.values()):
-        raise exceptions.BadMigration(
-            "Circular dependencies among these migrations {}".format(
-                ", ".join(
-                    m.id
-                    for m in forward_edges
-                    for n in {m} | set(forward_edges[m])
-                )
-            )
-        )
-
-    # Return the toposorted migrations followed by the remainder of migrations
-    # in their original order
-    return L + [m for m in migration_list if m not in to_toposort]
+    return get_graph(migration_list).topological_sort()
@@ -0,0 +1,134 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Display rows returned by migration steps.
+
+Rows are read from the cursor in batches and written out as they arrive,
+so memory use does not depend on the size of the result.
+"""
+
+from contextlib import contextmanager
+from itertools import chain
+from itertools import islice
+from logging import getLogger
+import csv
+import sys
+
+from yoyo.utils import plural
+
+logger = getLogger("yoyo.migrations")
+
+#: Output modes accepted by :func:`write_results`
+OUTPUT_MODES = ("none", "summary", "table", "csv")
+
+#: Number of rows fetched from the cursor at a time
+FETCH_ROWS = 500
+
+#: Number of rows read before writing a table, used to size its columns.
+#: Later values wider than their column are written in full.
+SAMPLE_ROWS = 100
+
+
+def iter_rows(cursor, batch_size=FETCH_ROWS):
+    """
+    Yield rows from ``cursor``, fetching ``batch_size`` rows at a time
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+@contextmanager
+def open_output(path=None):
+    """
+    Open ``path`` for appending, or use stdout if ``path`` is None
+    """
+    if path is None:
+        yield sys.stdout
+        return
+    with open(path, "a", encoding="UTF-8", newline="") as f:
+        yield f
+
+
+def write_results(cursor, out=None, mode="table", max_rows=None):
+    """
+    Write the rows returned by ``cursor`` to ``out``.
+
+    :param mode: one of :data:`OUTPUT_MODES`
+    :param max_rows: the maximum number of rows to read. Any further rows
+                     are left unread.
+    """
+    if mode not in OUTPUT_MODES:
+        raise ValueError("Unknown output mode: {!r}".format(mode))
+    if mode == "none":
+        return
+    if out is None:
+        out = sys.stdout
+
+    column_names = [desc[0] for desc in cursor.description]
+    if max_rows is None:
+        all_rows = rows = iter_rows(cursor)
+    else:
+        all_rows = iter_rows(cursor, min(FETCH_ROWS, max(max_rows, 1)))
+        rows = islice(all_rows, max_rows)
+
+    if mode == "summary":
+        count = sum(1 for row in rows)
+    elif mode == "csv":
+        count = _write_csv(out, column_names, rows)
+    else:
+        count = _write_table(out, column_names, rows)
+
+    truncated = max_rows is not None and next(all_rows, None) is not None
+    if mode == "csv":
+        if truncated:
+            logger.warning("Output truncated after %d rows", count)
+        return
+    if truncated:
+        out.write("(output truncated after {} rows)\n".format(count))
+    else:
+        out.write(plural(count, "(%d row)", "(%d rows)") + "\n")
+
+
+def _write_table(out, column_names, rows):
+    rows = ([str(value) for value in row] for row in rows)
+    sample = list(islice(rows, SAMPLE_ROWS))
+    column_sizes = [len(c) for c in column_names]
+    for row in sample:
+        for ix, value in enumerate(row):
+            if len(value) > column_sizes[ix]:
+                column_sizes[ix] = len(value)
+
+    format = "|".join(" %%- %ds " % size for size in column_sizes)
+    format += "\n"
+    out.write(format % tuple(column_names))
+    out.write("+".join("-" * (size + 2) for size in column_sizes) + "\n")
+    count = 0
+    for row in chain(sample, rows):
+        out.write(format % tuple(row))
+        count += 1
+    return count
+
+
+def _write_csv(out, column_names, rows):
+    writer = csv.writer(out)
+    writer.writerow(column_names)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from getpass import getpass
+from importlib import import_module
 import argparse
 import configparser
 import logging
@@ -28,6 +29,7 @@ from yoyo.config import find_config
 from yoyo.config import read_config
 from yoyo.config import save_config
 from yoyo.config import update_argparser_defaults
+from yoyo.output import OUTPUT_MODES
 
 verbosity_levels = {
     0: logging.ERROR,
@@ -42,6 +44,19 @@ max_verbosity = max(verbosity_levels)
 LEGACY_CONFIG_FILENAME = ".yoyo-migrate"
 
 
+#: The module implementing each command. Modules are imported only when
+#: one of their commands is run, or to show help.
+commands = {
+    "apply": "yoyo.scripts.migrate",
+    "rollback": "yoyo.scripts.migrate",
+    "reapply": "yoyo.scripts.migrate",
+    "mark": "yoyo.scripts.migrate",
+    "unmark": "yoyo.scripts.migrate",
+    "break-lock": "yoyo.scripts.migrate",
+    "new": "yoyo.scripts.newmigration",
+}
+
+
 class InvalidArgument(Exception):
     pass
 
@@ -59,12 +74,20 @@ def parse_args(argv=None):
         "database": "get",
         "verbosity": "getint",
         "migration_table": "get",
+        "cache_dir": "get",
+        "cache_max_size": "getint",
+        "jobs": "getint",
+        "sql_dialect": "get",
+        "output": "get",
+        "output_max_rows": "getint",
+        "output_file": "get",
     }
 
-    globalparser, argparser, subparsers = make_argparser()
+    globalparser = make_global_argparser()
 
-    # Initial parse to extract --config and any global arguments
-    global_args, _ = globalparser.parse_known_args(argv)
+    # Initial parse to extract --config and the name of the command
+    global_args, remaining = globalparser.parse_known_args(argv)
+    command = next((a for a in remaining if not a.startswith("-")), None)
 
     # Read the config file and create a dictionary of defaults for argparser
     config = read_config(
@@ -83,39 +106,49 @@ def parse_args(argv=None):
     if "sources" in defaults:
         defaults["sources"] = defaults["sources"].split()
 
-    # Set the argparser defaults to values read from the config file
-    update_argparser_defaults(globalparser, defaults)
+    # Set the argparser defaults to values read from the config file.
+    # Global args are left out of the subparsers' defaults: they are set once,
+    # by the top level parser.
+    _, argparser, subparsers = make_argparser(command, globalparser)
     update_argparser_defaults(argparser, defaults)
+    command_defaults = {
+        k: v for k, v in defaults.items() if k not in vars(global_args)
+    }
     for subp in subparsers.choices.values():
-        update_argparser_defaults(subp, defaults)
+        update_argparser_defaults(subp, command_defaults)
 
     # Now parse for real, starting from the top
     args = argparser.parse_args(argv)
 
-    # Update the args namespace with the global args.
-    # This ensures that global args (eg '-v) are recognized regardless
-    # of whether they were placed before or after the subparser command.
-    # If we do not do this then the sub_parser copy of the argument takes
-    # precedence, and overwrites any global args set before the command name.
-    args.__dict__.update(globalparser.parse_known_args(argv)[0].__dict__)
+    # '-v' may be given both before and after the command name
+    args.verbosity += vars(args).pop("command_verbosity", 0)
 
     return config, argparser, args
 
 
-def make_argparser():
+def make_global_argparser(suppress_defaults=False):
     """
-    Return a top-level ArgumentParser parser object,
-    plus a list of sub_parsers
+    Return an ArgumentParser for the arguments common to all commands.
+
+    :param suppress_defaults: if true, arguments that are not given are left
+                              unset. Used for the copies of the global
+                              arguments that may follow the command name,
+                              so that these don't overwrite any global
+                              arguments placed before the command name.
     """
+
+    def default(value):
+        return argparse.SUPPRESS if suppress_defaults else value
+
     global_parser = argparse.ArgumentParser(add_help=False)
     global_parser.add_argument(
-        "--config", "-c", default=None, help="Path to config file"
+        "--config", "-c", default=default(None), help="Path to config file"
     )
     global_parser.add_argument(
         "-v",
-        dest="verbosity",
+        dest="command_verbosity" if suppress_defaults else "verbosity",
         action="count",
-        default=min_verbosity,
+        default=default(min_verbosity),
         help="Verbose output. Use multiple times "
         "to increase level of verbosity",
     )
@@ -124,7 +157,7 @@ def make_argparser():
         "--batch",
         dest="batch_mode",
         action="store_true",
-        default=(not sys.stdout.isatty()),
+        default=default(not sys.stdout.isatty()),
         help="Run in batch mode" ". Turns off all user prompts",
     )
 
@@ -133,17 +166,36 @@ def make_argparser():
         "--no-cache",
         dest="use_config_file",
         action="store_false",
-        default=True,
+        default=default(True),
         help="Don't look for a yoyo.ini config file",
     )
+    return global_parser
+
+
+def make_argparser(command=None, global_parser=None):
+    """
+    Return a top-level ArgumentParser parser object,
+    plus a list of sub_parsers
+
+    :param command: the name of the command to be run. Only the module
+                    implementing this command is imported. If ``None`` or
+                    not a known command, all commands are loaded (eg to
+                    show the help for all commands).
+    """
+    if global_parser is None:
+        global_parser = make_global_argparser()
     argparser = argparse.ArgumentParser(prog="yoyo", parents=[global_parser])
 
     subparsers = argparser.add_subparsers(help="Commands help")
 
-    from . import migrate, newmigration
+    if command in commands:
+        modules = [commands[command]]
+    else:
+        modules = list(dict.fromkeys(commands.values()))
 
-    migrate.install_argparsers(global_parser, subparsers)
-    newmigration.install_argparsers(global_parser, subparsers)
+    command_parser = make_global_argparser(suppress_defaults=True)
+    for name in modules:
+        import_module(name).install_argparsers(command_parser, subparsers)
 
     return global_parser, argparser, subparsers
 
@@ -269,7 +321,32 @@ def get_backend(args, config):
     except AttributeError:
         pass
 
-    return connections.get_backend(dburi, migration_table)
+    # Values read from the config file are not checked by argparse
+    output = getattr(args, "output", None)
+    if output is not None and output not in OUTPUT_MODES:
+        raise InvalidArgument(
+            "Unknown output mode {!r}. Choose from {}".format(
+                output, ", ".join(OUTPUT_MODES)
+            )
+        )
+    output_max_rows = getattr(args, "output_max_rows", None)
+    if output_max_rows is not None and output_max_rows < 0:
+        raise InvalidArgument("output_max_rows must be 0 or more")
+
+    backend = connections.get_backend(dburi, migration_table)
+    for name in ["log_username", "log_hostname"]:
+        value = config.get("DEFAULT", name, fallback=None)
+        if value:
+            setattr(backend, name, value)
+    for name, attr in [
+        ("output", "output_mode"),
+        ("output_max_rows", "output_max_rows"),
+        ("output_file", "output_file"),
+    ]:
+        value = getattr(args, name, None)
+        if value is not None:
+            setattr(backend, attr, value)
+    return backend
 
 
 def main(argv=None):
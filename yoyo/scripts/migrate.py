@@ -23,7 +23,19 @@ from yoyo import (
     descendants,
 )
 from yoyo.scripts.main import InvalidArgument, get_backend
+from yoyo import exceptions
 from yoyo import utils
+from yoyo.output import OUTPUT_MODES
+
+
+def non_negative_int(s):
+    """
+    Argparse type for options that take an integer of 0 or more
+    """
+    value = int(s)
+    if value < 0:
+        raise argparse.ArgumentTypeError("must be 0 or more")
+    return value
 
 
 def install_argparsers(global_parser, subparsers):
@@ -81,6 +93,69 @@ def install_argparsers(global_parser, subparsers):
         help="Name of table to use for storing " "migration metadata",
     )
 
+    migration_parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Directory in which to cache parsed SQL migrations",
+        metavar="DIR",
+    )
+
+    migration_parser.add_argument(
+        "--cache-max-size",
+        dest="cache_max_size",
+        type=non_negative_int,
+        default=None,
+        help="Remove the least recently used cache entries once the cache "
+        "directory grows beyond BYTES (default: 64MB)",
+        metavar="BYTES",
+    )
+
+    migration_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=non_negative_int,
+        default=None,
+        help="Read migration files using N worker processes "
+        "(0 to use one per CPU)",
+        metavar="N",
+    )
+
+    migration_parser.add_argument(
+        "--sql-dialect",
+        dest="sql_dialect",
+        default=None,
+        help="Split SQL migrations into statements using the rules of "
+        "this dialect, rather than with sqlparse",
+    )
+
+    migration_parser.add_argument(
+        "--output",
+        dest="output",
+        choices=OUTPUT_MODES,
+        default=None,
+        help="How to display rows returned by migration steps "
+        "(default: table)",
+    )
+
+    migration_parser.add_argument(
+        "--output-max-rows",
+        dest="output_max_rows",
+        type=non_negative_int,
+        default=None,
+        help="Display at most N rows from each statement",
+        metavar="N",
+    )
+
+    migration_parser.add_argument(
+        "--output-file",
+        dest="output_file",
+        default=None,
+        help="Append rows returned by migration steps to FILE",
+        metavar="FILE",
+    )
+
     migration_parser.add_argument(
         "-r",
         "--revision",
@@ -94,6 +169,12 @@ def install_argparsers(global_parser, subparsers):
         parents=[global_parser, migration_parser],
     )
     parser_apply.set_defaults(func=apply, command_name="apply")
+    parser_apply.add_argument(
+        "--single-transaction",
+        dest="single_transaction",
+        action="store_true",
+        help="Apply all migrations in a single transaction",
+    )
 
     parser_rollback = subparsers.add_parser(
         "rollback",
@@ -144,7 +225,28 @@ def get_migrations(args, backend):
     if not sources:
         raise InvalidArgument("Please specify the migration source directory")
 
-    migrations = read_migrations(*sources)
+    if args.sql_dialect:
+        # Only load the statement splitters if they are used
+        from yoyo.sqlsplit import DIALECTS
+
+        if args.sql_dialect not in DIALECTS:
+            raise InvalidArgument(
+                "Unknown SQL dialect {!r}. Choose from {}".format(
+                    args.sql_dialect, ", ".join(sorted(DIALECTS))
+                )
+            )
+
+    # Values read from the config file are not checked by argparse
+    if args.jobs is not None and args.jobs < 0:
+        raise InvalidArgument("jobs must be 0 or more")
+
+    migrations = read_migrations(
+        *sources,
+        cache_dir=args.cache_dir,
+        cache_max_size=args.cache_max_size,
+        jobs=args.jobs,
+        sql_dialect=args.sql_dialect,
+    )
 
     if args.match:
         migrations = migrations.filter(
@@ -227,7 +329,14 @@ def apply(args, config):
     backend = get_backend(args, config)
     with backend.lock():
         migrations = get_migrations(args, backend)
-        backend.apply_migrations(migrations, args.force)
+        try:
+            backend.apply_migrations(
+                migrations,
+                args.force,
+                single_transaction=args.single_transaction,
+            )
+        except exceptions.SingleTransactionUnavailable as e:
+            raise InvalidArgument(str(e))
 
 
 def reapply(args, config):
@@ -262,7 +371,10 @@ def unmark(args, config):
 
 def break_lock(args, config):
     backend = get_backend(args, config)
-    backend.break_lock()
+    try:
+        backend.break_lock()
+    except exceptions.LockHeld as e:
+        raise InvalidArgument(str(e))
 
 
 def prompt_migrations(backend, migrations, direction):
@@ -281,6 +393,7 @@ def prompt_migrations(backend, migrations, direction):
             self.choice = default
 
     to_prompt = [prompted_migration(m) for m in migrations]
+    applied = backend.applied_status(migrations)
 
     position = 0
     while position < len(to_prompt):
@@ -288,11 +401,10 @@ def prompt_migrations(backend, migrations, direction):
 
         choice = mig.choice
         if choice is None:
-            is_applied = backend.is_applied(mig.migration)
             if direction == "apply":
-                choice = "n" if is_applied else "y"
+                choice = "n" if applied[mig.migration] else "y"
             else:
-                choice = "y" if is_applied else "n"
+                choice = "y" if applied[mig.migration] else "n"
         options = "".join(
             o.upper() if o == choice else o.lower() for o in "ynvdaqjk?"
         )
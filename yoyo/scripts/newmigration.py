@@ -25,11 +25,10 @@ import subprocess
 import sys
 import traceback
 
-from text_unidecode import unidecode
-
 from yoyo import default_migration_table
 from yoyo.config import CONFIG_NEW_MIGRATION_COMMAND_KEY
 from yoyo.migrations import read_migrations, heads, Migration
+from yoyo.migrations import tempfile_prefix
 from yoyo import utils
 from .main import InvalidArgument
 
@@ -37,8 +36,6 @@ from os import path, stat, unlink, rename
 
 logger = logging.getLogger("yoyo.migrations")
 
-tempfile_prefix = "_tmp_yoyonew"
-
 migration_template = dedent(
     '''\
     """
@@ -131,6 +128,8 @@ def new_migration(args, config):
 
 
 def slugify(message):
+    from text_unidecode import unidecode
+
     s = unidecode(message)
     s = re.sub(re.compile(r"[^-a-z0-9]+"), "-", s.lower())
     s = re.compile(r"-{2,}").sub("-", s).strip("-")
@@ -0,0 +1,938 @@
+# Copyright 2015 Oliver Cope
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Split SQL scripts into statements.
+
+Unlike ``sqlparse.split``, the script is read in chunks and statements are
+yielded as soon as they are complete, so memory use is bounded by the
+size of the largest statement rather than the size of the file. Only the
+tokens needed to find statement boundaries are recognized: quoted strings
+and identifiers, comments, parentheses and the keywords that open and
+close blocks.
+
+:class:`StatementSplitter` splits statements in the same places as
+``sqlparse.split``. Its subclasses follow the syntax of a single database
+(see :data:`DIALECTS`), for example recognizing MySQL's ``DELIMITER``
+command or the ``/`` line that ends an Oracle PL/SQL block.
+"""
+
+from io import StringIO
+import re
+
+#: Changed whenever the splitting rules change, so that cached results from
+#: earlier versions are discarded
+VERSION = 1
+
+#: Number of characters read from the file at a time
+CHUNK_SIZE = 1 << 16
+
+#: Tokens ending closer than this to the end of the buffer are not
+#: processed until more input has been read, so that keywords can be
+#: examined in context (eg ``END IF``)
+LOOKAHEAD = 64
+
+_transaction_words = {
+    "TRANSACTION",
+    "WORK",
+    "TRAN",
+    "DISTRIBUTED",
+    "DEFERRED",
+    "IMMEDIATE",
+    "EXCLUSIVE",
+}
+
+#: Words that may change the block nesting level
+_block_words = _transaction_words | {
+    "CREATE",
+    "DECLARE",
+    "BEGIN",
+    "END",
+    "FOR",
+    "WHILE",
+    "LOOP",
+    "DO",
+    "IF",
+    "CASE",
+}
+
+_whitespace_kinds = {"space", "newline", "comment", "multiline"}
+
+# Regular expression fragments shared by the dialects
+_NEWLINE = r"\r\n|\r|\n"
+_SPACE = r"[^\S\r\n]+"
+_LINE_COMMENT = r"--[^\r\n]*(?:\r\n|\r|\n)?"
+_MULTILINE = r"/\*.*?\*/"
+_SINGLE_QUOTED = r"'[^'\\]*(?:(?:''|\\.)[^'\\]*)*'"
+_DOUBLE_QUOTED = r'"[^"\\]*(?:(?:""|\\.)[^"\\]*)*"'
+_BACKTICKED = r"`[^`]*(?:``[^`]*)*`"
+_STANDARD_SINGLE_QUOTED = r"'[^']*(?:''[^']*)*'"
+_STANDARD_DOUBLE_QUOTED = r'"[^"]*(?:""[^"]*)*"'
+_OPEN_BRACKET = r"(?<![\w\])])\["
+_BRACKETED = _OPEN_BRACKET + r"[^\]\[]+\]"
+
+# Fragments used to skip over runs of tokens that can't end a statement.
+# These must match exactly one way, so that the regular expression engine
+# does not try every way of splitting a run into tokens when a
+# parenthesized group fails to match.
+_SKIP_SPACE = r"\s+(?!\s)"
+_SKIP_LINE_COMMENT = r"--[^\r\n]*(?:\r\n|\r|\n)"
+_SKIP_MULTILINE = r"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
+
+
+def _closed(pattern):
+    """
+    Return ``pattern``, which matches a quoted string, followed by a check
+    that the string is not immediately followed by another opening quote
+    """
+    return "{}(?!{})".format(pattern, re.escape(pattern[0]))
+
+
+def _words(words, tail=r"[$\#\w]"):
+    """
+    Return a pattern matching any of ``words`` as a whole word
+    """
+    return r"(?i:{})(?!{})".format("|".join(sorted(words)), tail)
+
+
+def _skip_pattern(whitespace, tokens):
+    """
+    Compile a pattern matching a run of ``whitespace`` and ``tokens``
+    (neither of which may contain named groups) and flat parenthesized
+    groups of these. Group ``content`` is set if anything other than
+    whitespace was matched.
+    """
+    return re.compile(
+        r"""
+        (?:
+            {ws}
+          | (?P<content>
+                \( (?:{ws}|{tokens})* \)
+              | {tokens}
+            )
+        )*
+        """.format(
+            ws=whitespace, tokens=tokens
+        ),
+        re.S | re.X,
+    )
+
+
+_token = re.compile(
+    r"""
+      (?P<newline>\r\n|\r|\n)
+    | (?P<space>[^\S\r\n]+)
+    | (?P<comment>(?:--|\#\ )[^\r\n]*(?:\r\n|\r|\n)?)
+    | (?P<multiline>/\*.*?\*/)
+    | (?P<quoted>
+          '[^'\\]*(?:(?:''|\\.)[^'\\]*)*'
+        | "[^"\\]*(?:(?:""|\\.)[^"\\]*)*"
+        | `[^`]*(?:``[^`]*)*`
+        | (?<![\w\])])\[[^\]\[]+\]
+      )
+    | (?P<dollar>(?<![\w"$])\$(?:[^\W\d]\w*)?\$)
+    | (?P<placeholder>(?<!\w)[$:?]\w+|\\\w+)
+    | (?P<number>\d+(?![^\W\d]))
+    | (?P<word>(?i:CASE|IN|VALUES|USING|FROM|AS|END|CREATE)\b|\w[$\#\w]*)
+    | (?P<punct>[;()])
+    | (?P<other>.)
+    """,
+    re.S | re.X,
+)
+
+_skip = _skip_pattern(
+    r"(?:{}|(?:--|\#\ )[^\r\n]*(?:\r\n|\r|\n)|{})".format(
+        _SKIP_SPACE, _SKIP_MULTILINE
+    ),
+    r"""(?:
+          {quoted}
+        | (?<!\w)[:?]\w+(?!\w) | \\\w+(?!\w)
+        | \d+(?!\w)
+        | (?i:IN|VALUES|USING|FROM|AS)\b
+        | (?<=\.)\w+(?!\w)
+        | (?<!\.)(?!(?i:CASE|IN|VALUES|USING|FROM|AS|END|CREATE)\b)
+          (?!{keywords})
+          \w[$\#\w]*(?![$\#\w])
+        | (?!--|/\*|\#\ |{bracket})[^\s\w'"`$;()]
+    )""".format(
+        quoted="|".join(
+            list(map(_closed, [_SINGLE_QUOTED, _DOUBLE_QUOTED, _BACKTICKED]))
+            + [_BRACKETED]
+        ),
+        bracket=_OPEN_BRACKET,
+        keywords=_words(_block_words),
+    ),
+)
+
+_placeholder = re.compile(r"\$\w*")
+_name = re.compile(r"\w+")
+_not_keyword = re.compile(r"\s*\.(?!\d)|\(")
+_end_qualifier = re.compile(r"\s+(IF|LOOP|WHILE|FOR|CASE)\b", re.I)
+_if_exists = re.compile(r"\s+(?:NOT\s+)?EXISTS\b", re.I)
+
+
+class StatementSplitter(object):
+    """
+    Split a stream of SQL into statements.
+
+    Statements are terminated by semicolons, except within ``BEGIN ...
+    END`` blocks (eg in trigger and stored procedure definitions).
+    Whitespace and single line comments following a semicolon on the same
+    line are kept with the preceding statement.
+
+    Subclasses may replace :attr:`token` and :attr:`skip` to change how
+    the input is tokenized, and override :meth:`_word`, :meth:`_punct`
+    and :meth:`_other` to change where statements end.
+    """
+
+    #: Pattern matching a single token, with one named group per kind
+    token = _token
+
+    #: Pattern matching a run of tokens that can't affect where the
+    #: statement ends (see :func:`_skip_pattern`)
+    skip = _skip
+
+    #: Pattern matching the start of a token that may continue beyond the
+    #: end of the buffer
+    opener = re.compile(
+        r"""['"`]|/\*|{}[^\]\[]*\Z""".format(_OPEN_BRACKET)
+    )
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def split(self, f):
+        """
+        Yield the statements read from the file-like object ``f``, stripped
+        of surrounding whitespace
+        """
+        self._reset()
+        self.prefix = ""
+        self.offset = 0
+        buf = ""
+        pos = 0
+        safe = 0
+        eof = False
+        while True:
+            if pos < safe and not self.consume_ws:
+                # Skip over text that can't end the statement. Only text up
+                # to the last whitespace or comma in the buffer is
+                # examined, so that tokens are not cut short by the end of
+                # the buffer.
+                m = self.skip.match(buf, pos, safe)
+                if m.end() != pos:
+                    self._skipped(m)
+                    pos = m.end()
+
+            while not eof and pos + LOOKAHEAD >= len(buf):
+                buf, pos, safe, eof = self._read(f, buf, pos)
+            if pos >= len(buf):
+                break
+            m = self.token.match(buf, pos)
+            kind = m.lastgroup
+            end = m.end()
+            if kind == "dollar" or kind == "nested":
+                end = self._close(kind, buf, pos, end, eof)
+                if end is not None and kind == "dollar":
+                    kind = "quoted"
+            if not eof and (
+                end is None
+                or end + LOOKAHEAD > len(buf)
+                or (kind == "other" and self._may_continue(buf, pos))
+            ):
+                # The token may continue beyond the end of the buffer
+                buf, pos, safe, eof = self._read(f, buf, pos)
+                continue
+            if end is None:
+                # An unclosed dollar quote at the end of the input
+                kind = "placeholder"
+                end = _placeholder.match(buf, pos).end()
+
+            if self.consume_ws and not (
+                kind == "space"
+                or (kind == "comment" and buf[pos + 2 : pos + 3] != "+")
+            ):
+                yield self._statement(buf, pos)
+                self._reset(pos)
+
+            if kind in _whitespace_kinds or kind == "nested":
+                pos = end
+                continue
+            if kind == "word":
+                if pos and buf[pos - 1] == ".":
+                    # A column or table name, eg "t.end"
+                    end = _name.match(buf, pos).end()
+                    self.seen_begin = False
+                else:
+                    end = self._word(buf, pos, end)
+            elif kind == "punct":
+                self._punct(m.group())
+            else:
+                end = self._other(kind, buf, pos, end)
+            self.blank = False
+            pos = end
+
+            if self.boundary is not None:
+                statement_end, pos = self.boundary
+                if statement_end is not None:
+                    statement = self._statement(buf, statement_end)
+                    if statement:
+                        yield statement
+                self._reset(pos)
+
+        statement = self._statement(buf, len(buf))
+        if statement:
+            yield statement
+
+    def _read(self, f, buf, pos):
+        """
+        Discard text belonging to statements already returned and read
+        more input. The amount read grows with the buffer, so that long
+        tokens are not rescanned many times. A few characters before the
+        current statement are kept, so that they can be examined by
+        lookbehind assertions.
+
+        :return: a tuple of ``(buf, pos, safe, eof)``, where ``safe`` is
+                 the position following the last whitespace or comma in
+                 the buffer
+        """
+        keep = max(self.start - LOOKAHEAD, 0)
+        chunk = f.read(max(self.chunk_size, len(buf) - self.start))
+        buf = buf[keep:] + chunk
+        pos -= keep
+        self.start -= keep
+        self.offset += keep
+        if not chunk:
+            return buf, pos, len(buf), True
+        safe = max(buf.rfind(" "), buf.rfind("\n"), buf.rfind(",")) + 1
+        return buf, pos, safe, False
+
+    def _may_continue(self, buf, pos):
+        """
+        Return True if the unmatched character at ``pos`` opens a quoted
+        string or comment that may be closed later in the input
+        """
+        return self.opener.match(buf, pos) is not None
+
+    def _close(self, kind, buf, pos, end, eof):
+        """
+        Return the end of the token opened by ``buf[pos:end]``, or None if
+        it is not closed within the buffer
+        """
+        close = buf.find(buf[pos:end], end)
+        if close == -1:
+            return None
+        return close + end - pos
+
+    def _statement(self, buf, end):
+        """
+        Return the current statement, which ends at ``end``
+        """
+        statement = buf[self.start : end]
+        if self.prefix:
+            statement = self.prefix + statement
+            self.prefix = ""
+        return statement.strip()
+
+    def _reset(self, start=0):
+        self.start = start
+        self.boundary = None
+        self.blank = True
+        self.level = 0
+        self.block_stack = []
+        self.unconfirmed_start = None
+        self.is_create = False
+        self.seen_begin = False
+        self.consume_ws = False
+
+    def _end_statement(self, end, next_start):
+        """
+        End the current statement at ``end`` (or discard it, if ``end`` is
+        None), and start the next at ``next_start``
+        """
+        self.boundary = (end, next_start)
+
+    def _skipped(self, m):
+        """
+        Update the state after a run of tokens has been skipped
+        """
+        if m.start("content") != -1:
+            self.seen_begin = False
+            self.blank = False
+
+    def _other(self, kind, buf, pos, end):
+        """
+        Handle a token other than a word or punctuation. Return the
+        position of the end of the token.
+        """
+        self.seen_begin = False
+        return end
+
+    def _punct(self, value):
+        if value == "(":
+            self.level += 1
+        elif value == ")":
+            self.level -= 1
+        else:
+            self.unconfirmed_start = None
+            if self.seen_begin:
+                self.seen_begin = False
+                if self.block_stack and self.block_stack[-1] == "BEGIN":
+                    self.block_stack.pop()
+                    self.level -= 1
+            if self.level <= 0 and "BEGIN" not in self.block_stack:
+                self.consume_ws = True
+            return
+        self.seen_begin = False
+
+    def _word(self, buf, pos, end):
+        """
+        Update the block nesting level for the word at ``buf[pos:end]``.
+        Return the position of the end of the keyword, which may span
+        several words (eg ``END IF``).
+        """
+        unified = buf[pos:end].upper()
+        if unified not in _block_words or (
+            unified != "CASE" and _not_keyword.match(buf, end)
+        ):
+            self.seen_begin = False
+            return end
+
+        if unified == "END":
+            qualifier = _end_qualifier.match(buf, end)
+            if qualifier:
+                unified = "END " + qualifier.group(1).upper()
+                end = qualifier.end()
+        elif unified == "IF":
+            if_exists = _if_exists.match(buf, end)
+            if if_exists:
+                self.seen_begin = False
+                return if_exists.end()
+
+        if unified == "BEGIN":
+            self.seen_begin = True
+        else:
+            self.level += self._change_level(unified)
+            self.seen_begin = False
+            return end
+        if self.block_stack and self.block_stack[-1] == "DECLARE":
+            self.block_stack[-1] = "BEGIN"
+        else:
+            self.block_stack.append("BEGIN")
+            self.level += 1
+        return end
+
+    def _change_level(self, unified):
+        stack = self.block_stack
+        if unified == "CREATE":
+            self.is_create = True
+            return 0
+
+        if unified == "DECLARE" and self.is_create and not stack:
+            stack.append("DECLARE")
+            return 1
+
+        if self.seen_begin and unified in _transaction_words:
+            if stack and stack[-1] == "BEGIN":
+                stack.pop()
+                return -1
+            return 0
+
+        if "BEGIN" in stack:
+            if unified in ("FOR", "WHILE"):
+                self.unconfirmed_start = unified
+                return 0
+            if unified in ("LOOP", "DO"):
+                if self.unconfirmed_start in ("FOR", "WHILE"):
+                    stack.append(self.unconfirmed_start)
+                    self.unconfirmed_start = None
+                    return 1
+                if unified == "LOOP":
+                    stack.append("LOOP")
+                    return 1
+            if unified in ("IF", "CASE"):
+                stack.append(unified)
+                return 1
+
+        if unified == "END":
+            if stack:
+                stack.pop()
+            return -1
+        if unified.startswith("END "):
+            opener = unified[4:]
+            if stack and (
+                stack[-1] == opener
+                or (opener == "LOOP" and stack[-1] in ("FOR", "WHILE"))
+            ):
+                stack.pop()
+                return -1
+        return 0
+
+
+class _BlockSplitter(StatementSplitter):
+    """
+    Base class for dialects where the only unquoted blocks are ``BEGIN
+    ... END`` blocks containing ``CASE ... END`` expressions.
+    :meth:`_word` increments :attr:`depth` on entering a block.
+    """
+
+    def _reset(self, start=0):
+        super(_BlockSplitter, self)._reset(start)
+        self.depth = 0
+
+    def _punct(self, value):
+        if value == "(":
+            self.level += 1
+        elif value == ")":
+            self.level -= 1
+        elif self.level <= 0 and not self.depth:
+            self.consume_ws = True
+
+    def _word(self, buf, pos, end):
+        unified = buf[pos:end].upper()
+        if unified == "END":
+            if self.depth:
+                self.depth -= 1
+        elif unified == "CASE":
+            if self.depth:
+                self.depth += 1
+        return end
+
+
+_atomic = re.compile(r"\s+ATOMIC\b", re.I)
+
+
+class PostgresqlSplitter(_BlockSplitter):
+    """
+    Split PostgreSQL scripts.
+
+    Dollar quoted strings, escape strings (``E'...'``) and nested comments
+    are recognized, and backslashes are not treated as escape characters
+    in other strings. Function bodies are normally quoted, so the only
+    unquoted blocks are SQL-standard ``BEGIN ATOMIC ... END`` bodies.
+    """
+
+    token = re.compile(
+        r"""
+          (?P<newline>{newline})
+        | (?P<space>{space})
+        | (?P<comment>{comment})
+        | (?P<nested>/\*)
+        | (?P<quoted>
+              (?<![\w$])[eE]'[^'\\]*(?:(?:''|\\.)[^'\\]*)*'
+            | {single} | {double}
+          )
+        | (?P<dollar>(?<![\w$])\$(?:[^\W\d]\w*)?\$)
+        | (?P<word>\w[$\w]*)
+        | (?P<punct>[;()])
+        | (?P<other>.)
+        """.format(
+            newline=_NEWLINE,
+            space=_SPACE,
+            comment=_LINE_COMMENT,
+            single=_STANDARD_SINGLE_QUOTED,
+            double=_STANDARD_DOUBLE_QUOTED,
+        ),
+        re.S | re.X,
+    )
+
+    skip = _skip_pattern(
+        r"(?:{}|{}|/\*[^*/]*(?:\*+(?![*/])[^*/]*|/(?!\*)[^*/]*)*\*/)".format(
+            _SKIP_SPACE, _SKIP_LINE_COMMENT
+        ),
+        r"""(?:
+              (?<![\w$])[eE]{escape} | {quoted}
+            | (?!{keywords})(?![eE]')\w[$\w]*(?![$\w])
+            | (?<![\w$])\$\d+(?!\w)
+            | (?!--|/\*)[^\s\w'"$;()]
+        )""".format(
+            escape=_closed(_SINGLE_QUOTED),
+            quoted="|".join(
+                map(
+                    _closed, [_STANDARD_SINGLE_QUOTED, _STANDARD_DOUBLE_QUOTED]
+                )
+            ),
+            keywords=_words(["BEGIN", "CASE", "END"], r"[$\w]"),
+        ),
+    )
+
+    opener = re.compile(r"['\"]")
+
+    def _close(self, kind, buf, pos, end, eof):
+        if kind == "dollar":
+            return super(PostgresqlSplitter, self)._close(
+                kind, buf, pos, end, eof
+            )
+        # Comments may be nested
+        depth = 1
+        while depth:
+            close = buf.find("*/", end)
+            if close == -1:
+                return len(buf) if eof else None
+            opening = buf.find("/*", end, close)
+            if opening == -1:
+                depth -= 1
+                end = close + 2
+            else:
+                depth += 1
+                end = opening + 2
+        return end
+
+    def _word(self, buf, pos, end):
+        if buf[pos:end].upper() == "BEGIN":
+            atomic = _atomic.match(buf, end)
+            if atomic:
+                self.depth += 1
+                return atomic.end()
+            return end
+        return super(PostgresqlSplitter, self)._word(buf, pos, end)
+
+
+_delimiter_command = re.compile(
+    r"[^\S\r\n]+(\S+)[^\r\n]*(?:\r\n|\r|\n|$)", re.I
+)
+
+
+class MysqlSplitter(StatementSplitter):
+    """
+    Split MySQL scripts.
+
+    ``#`` comments are recognized, and ``--`` only starts a comment when
+    followed by whitespace. The ``DELIMITER`` command of the ``mysql``
+    client changes the statement terminator: statements are then split at
+    each occurrence of the new delimiter, which is removed from the
+    statement. The ``DELIMITER`` lines themselves are removed.
+    """
+
+    _comment = r"\#[^\r\n]*(?:\r\n|\r|\n)?|--(?!\S)[^\r\n]*(?:\r\n|\r|\n)?"
+    _skip_comment = r"\#[^\r\n]*(?:\r\n|\r|\n)|--(?!\S)[^\r\n]*(?:\r\n|\r|\n)"
+    _quoted = "|".join([_SINGLE_QUOTED, _DOUBLE_QUOTED, _BACKTICKED])
+    _skip_quoted = "|".join(
+        map(_closed, [_SINGLE_QUOTED, _DOUBLE_QUOTED, _BACKTICKED])
+    )
+
+    token = re.compile(
+        r"""
+          (?P<newline>{newline})
+        | (?P<space>{space})
+        | (?P<comment>{comment})
+        | (?P<multiline>{multiline})
+        | (?P<quoted>{quoted})
+        | (?P<word>\w[$\w]*)
+        | (?P<punct>[;()])
+        | (?P<other>.)
+        """.format(
+            newline=_NEWLINE,
+            space=_SPACE,
+            comment=_comment,
+            multiline=_MULTILINE,
+            quoted=_quoted,
+        ),
+        re.S | re.X,
+    )
+
+    skip = _skip_pattern(
+        r"(?:{}|{}|{})".format(_SKIP_SPACE, _skip_comment, _SKIP_MULTILINE),
+        r"""(?:
+              {quoted}
+            | (?!{keywords})\w[$\w]*(?![$\w])
+            | (?!--(?!\S)|/\*)[^\s\w'"`\#;()]
+        )""".format(
+            quoted=_skip_quoted,
+            keywords=_words(_block_words | {"DELIMITER"}, r"[$\w]"),
+        ),
+    )
+
+    opener = re.compile(r"['\"`]|/\*")
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        super(MysqlSplitter, self).__init__(chunk_size)
+        self._set_delimiter(";")
+
+    def _set_delimiter(self, delimiter):
+        self.delimiter = delimiter
+        if delimiter == ";":
+            self.token = MysqlSplitter.token
+            self.skip = MysqlSplitter.skip
+            return
+        not_delimiter = "(?!{})".format(re.escape(delimiter))
+        self.token = re.compile(
+            r"""
+              (?P<delimiter>{delimiter})
+            | (?P<newline>{newline})
+            | (?P<space>{space})
+            | (?P<comment>{comment})
+            | (?P<multiline>{multiline})
+            | (?P<quoted>{quoted})
+            | (?P<word>\w(?:{not_delimiter}[$\w])*)
+            | (?P<other>.)
+            """.format(
+                delimiter=re.escape(delimiter),
+                not_delimiter=not_delimiter,
+                newline=_NEWLINE,
+                space=_SPACE,
+                comment=self._comment,
+                multiline=_MULTILINE,
+                quoted=self._quoted,
+            ),
+            re.S | re.X,
+        )
+        self.skip = _skip_pattern(
+            r"(?:{}(?:{}|{}|{}))".format(
+                not_delimiter, _SKIP_SPACE, self._skip_comment, _SKIP_MULTILINE
+            ),
+            r"""(?:{not_delimiter}(?:
+                  {quoted}
+                | (?!{keyword})\w(?:{not_delimiter}[$\w])*
+                  (?!{not_delimiter}[$\w])
+                | (?!--(?!\S)|/\*)[^\s\w'"`\#]
+            ))""".format(
+                not_delimiter=not_delimiter,
+                quoted=self._skip_quoted,
+                keyword=_words(["DELIMITER"], r"[$\w]"),
+            ),
+        )
+
+    def _other(self, kind, buf, pos, end):
+        if kind == "delimiter":
+            self._end_statement(pos, end)
+        return super(MysqlSplitter, self)._other(kind, buf, pos, end)
+
+    def _word(self, buf, pos, end):
+        if self.blank and buf[pos:end].upper() == "DELIMITER":
+            command = _delimiter_command.match(buf, end)
+            if command:
+                # Keep any comments preceding the command with the next
+                # statement
+                self.prefix += buf[self.start : pos]
+                self._set_delimiter(command.group(1))
+                self._end_statement(None, command.end())
+                return command.end()
+        if self.delimiter != ";":
+            return end
+        return super(MysqlSplitter, self)._word(buf, pos, end)
+
+
+_plsql_create = re.compile(
+    r"""
+    \s+(?:OR\s+REPLACE\s+)?
+    (?:(?:NON)?EDITIONABLE\s+)?
+    (?:FUNCTION|PROCEDURE|PACKAGE|TRIGGER|TYPE|LIBRARY|JAVA)\b
+    """,
+    re.I | re.X,
+)
+_slash_line = re.compile(r"[^\S\r\n]*(?:\r\n|\r|\n|$)")
+
+
+class OracleSplitter(StatementSplitter):
+    """
+    Split Oracle scripts, following the rules used by SQL*Plus.
+
+    PL/SQL blocks (``DECLARE`` or ``BEGIN`` blocks and ``CREATE
+    FUNCTION``, ``PROCEDURE``, ``PACKAGE``, ``TRIGGER`` or ``TYPE``
+    statements) may contain semicolons and are only ended by a line
+    containing a single ``/``, which is removed. Other statements are also
+    ended by a semicolon. Alternative quoting (``q'[...]'``) is recognized.
+    """
+
+    token = re.compile(
+        r"""
+          (?P<newline>{newline})
+        | (?P<space>{space})
+        | (?P<comment>{comment})
+        | (?P<multiline>{multiline})
+        | (?P<quoted>
+              (?<![\w$\#])[nN]?[qQ]'
+              (?:
+                  \[.*?\] | \{{.*?\}} | \(.*?\) | <.*?>
+                | (?P<q>[^\s\[{{(<]).*?(?P=q)
+              )'
+            | {single} | {double}
+          )
+        | (?P<word>\w[$\#\w]*)
+        | (?P<punct>[;()])
+        | (?P<other>.)
+        """.format(
+            newline=_NEWLINE,
+            space=_SPACE,
+            comment=_LINE_COMMENT,
+            multiline=_MULTILINE,
+            single=_STANDARD_SINGLE_QUOTED,
+            double=_STANDARD_DOUBLE_QUOTED,
+        ),
+        re.S | re.X,
+    )
+
+    skip = _skip_pattern(
+        r"(?:{}|{}|{})".format(
+            _SKIP_SPACE, _SKIP_LINE_COMMENT, _SKIP_MULTILINE
+        ),
+        r"""(?:
+              {quoted}
+            | (?!{keywords})(?![nN]?[qQ]')\w[$\#\w]*(?![$\#\w])
+            | (?!--)[^\s\w'"/;()]
+        )""".format(
+            quoted="|".join(
+                map(
+                    _closed, [_STANDARD_SINGLE_QUOTED, _STANDARD_DOUBLE_QUOTED]
+                )
+            ),
+            keywords=_words(["BEGIN", "CREATE", "DECLARE"]),
+        ),
+    )
+
+    opener = re.compile(r"['\"]|/\*")
+
+    def _reset(self, start=0):
+        super(OracleSplitter, self)._reset(start)
+        self.plsql = False
+
+    def _punct(self, value):
+        if value == ";" and self.plsql:
+            return
+        super(OracleSplitter, self)._punct(value)
+
+    def _word(self, buf, pos, end):
+        if self.blank:
+            unified = buf[pos:end].upper()
+            if unified in ("BEGIN", "DECLARE"):
+                self.plsql = True
+            elif unified == "CREATE":
+                self.plsql = bool(_plsql_create.match(buf, end))
+        return end
+
+    def _other(self, kind, buf, pos, end):
+        if buf[pos] == "/" and self._at_line_start(buf, pos):
+            line = _slash_line.match(buf, end)
+            if line:
+                self._end_statement(pos, line.end())
+                return line.end()
+        return end
+
+    def _at_line_start(self, buf, pos):
+        while pos and buf[pos - 1] in " \t":
+            pos -= 1
+        if pos == 0:
+            return self.offset == 0
+        return buf[pos - 1] in "\r\n"
+
+
+_create_trigger = re.compile(r"\s+(?:TEMP(?:ORARY)?\s+)?TRIGGER\b", re.I)
+
+
+class SqliteSplitter(_BlockSplitter):
+    """
+    Split SQLite scripts.
+
+    ``CREATE TRIGGER`` statements may contain semicolons between ``BEGIN``
+    and ``END``. Identifiers may be quoted with square brackets, and
+    backslashes are not treated as escape characters.
+    """
+
+    token = re.compile(
+        r"""
+          (?P<newline>{newline})
+        | (?P<space>{space})
+        | (?P<comment>{comment})
+        | (?P<multiline>/\*.*?(?:\*/|\Z))
+        | (?P<quoted>{single} | {double} | {backticked} | \[[^\]]*\])
+        | (?P<word>\w[$\w]*)
+        | (?P<punct>[;()])
+        | (?P<other>.)
+        """.format(
+            newline=_NEWLINE,
+            space=_SPACE,
+            comment=_LINE_COMMENT,
+            single=_STANDARD_SINGLE_QUOTED,
+            double=_STANDARD_DOUBLE_QUOTED,
+            backticked=_BACKTICKED,
+        ),
+        re.S | re.X,
+    )
+
+    skip = _skip_pattern(
+        r"(?:{}|{}|{})".format(
+            _SKIP_SPACE, _SKIP_LINE_COMMENT, _SKIP_MULTILINE
+        ),
+        r"""(?:
+              {quoted} | \[[^\]]*\]
+            | (?!{keywords})\w[$\w]*(?![$\w])
+            | (?!--|/\*)[^\s\w'"`\[;()]
+        )""".format(
+            quoted="|".join(
+                map(
+                    _closed,
+                    [
+                        _STANDARD_SINGLE_QUOTED,
+                        _STANDARD_DOUBLE_QUOTED,
+                        _BACKTICKED,
+                    ],
+                )
+            ),
+            keywords=_words(["BEGIN", "CASE", "CREATE", "END"], r"[$\w]"),
+        ),
+    )
+
+    opener = re.compile(r"['\"`\[]|/\*")
+
+    def _reset(self, start=0):
+        super(SqliteSplitter, self)._reset(start)
+        self.trigger = False
+
+    def _word(self, buf, pos, end):
+        unified = buf[pos:end].upper()
+        if unified == "CREATE":
+            if self.blank:
+                self.trigger = bool(_create_trigger.match(buf, end))
+        elif unified == "BEGIN":
+            if self.trigger and not self.depth:
+                self.depth = 1
+        else:
+            return super(SqliteSplitter, self)._word(buf, pos, end)
+        return end
+
+
+#: Statement splitters by dialect name
+DIALECTS = {
+    "generic": StatementSplitter,
+    "postgresql": PostgresqlSplitter,
+    "mysql": MysqlSplitter,
+    "oracle": OracleSplitter,
+    "sqlite": SqliteSplitter,
+}
+
+
+def get_splitter(dialect="generic", chunk_size=CHUNK_SIZE):
+    """
+    Return a statement splitter for ``dialect``, one of :data:`DIALECTS`
+    """
+    try:
+        splitter_class = DIALECTS[dialect]
+    except KeyError:
+        raise ValueError("Unknown SQL dialect: {!r}".format(dialect))
+    return splitter_class(chunk_size)
+
+
+def iter_statements(f, chunk_size=CHUNK_SIZE, dialect="generic"):
+    """
+    Yield the statements read from the file-like object ``f``
+    """
+    return get_splitter(dialect, chunk_size).split(f)
+
+
+def split(sql, dialect="generic"):
+    """
+    Return a list of the statements in the string ``sql``
+    """
+    return list(iter_statements(StringIO(sql), dialect=dialect))
@@ -60,6 +60,9 @@ class TestTransactionHandling(object):
         }
         if backend.__class__ in expected:
             assert backend.has_transactional_ddl is expected[backend.__class__]
+            assert backend._check_transactional_ddl() is expected[
+                backend.__class__
+            ]
 
     def test_non_transactional_ddl_behaviour(self, backend):
         """
@@ -144,6 +147,312 @@ class TestTransactionHandling(object):
             assert "yoyo_test_c" in backend.list_tables()
 
 
+class TestTablesExist(object):
+    def test_it_returns_existing_tables(self, backend):
+        assert backend.tables_exist(["yoyo_t", "yoyo_missing"]) == {"yoyo_t"}
+        assert backend.tables_exist([]) == set()
+
+    def test_table_exists(self, backend):
+        assert backend.table_exists("yoyo_t") is True
+        assert backend.table_exists("yoyo_missing") is False
+
+    def test_it_checks_the_internal_schema_once(self, backend):
+        backend.ensure_internal_schema_updated()
+        with patch("yoyo.internalmigrations.needs_upgrading") as check:
+            backend.ensure_internal_schema_updated()
+            assert check.call_count == 0
+
+
+class TestAppliedMigrations(object):
+    def count_queries(self, backend):
+        return patch.object(
+            backend, "execute_statement", wraps=backend.execute_statement
+        )
+
+    def test_it_reads_applied_migrations_once_while_locked(self, backend):
+        with with_migrations(a="", b="", c="") as tmpdir:
+            migrations = read_migrations(tmpdir)
+            backend.apply_migrations(migrations[:1])
+            with backend.lock(), self.count_queries(backend) as execute:
+                to_apply = backend.to_apply(migrations)
+                assert [m.id for m in to_apply] == ["b", "c"]
+                assert backend.is_applied(migrations[0])
+                backend.mark_migrations(migrations[1:2])
+                assert backend.is_applied(migrations[1])
+                backend.unmark_migrations(migrations[:1])
+                assert not backend.is_applied(migrations[0])
+                to_rollback = backend.to_rollback(migrations)
+                assert [m.id for m in to_rollback] == ["b"]
+                applied_queries = [
+                    c
+                    for c in execute.call_args_list
+                    if c[0][0] == "applied_migrations"
+                ]
+                assert len(applied_queries) == 1
+
+    def test_it_returns_applied_status(self, backend):
+        with with_migrations(a="", b="") as tmpdir:
+            migrations = read_migrations(tmpdir)
+            backend.apply_migrations(migrations[:1])
+            with self.count_queries(backend) as execute:
+                assert backend.applied_status(migrations) == {
+                    migrations[0]: True,
+                    migrations[1]: False,
+                }
+                assert execute.call_count == 1
+
+    def test_it_discards_state_on_rollback(self, backend):
+        with with_migrations(a="") as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with backend.lock():
+                assert not backend.is_applied(migrations[0])
+                with backend.transaction() as t:
+                    backend.mark_one(migrations[0])
+                    assert backend.is_applied(migrations[0])
+                    t.rollback()
+                assert not backend.is_applied(migrations[0])
+
+    def test_it_orders_by_applied_time(self, backend):
+        with with_migrations(a="", b="") as tmpdir:
+            a, b = read_migrations(tmpdir)
+            backend.mark_migrations([b])
+            backend.mark_migrations([a])
+            applied = backend.get_applied_migrations()
+            assert list(applied) == [b.hash, a.hash]
+            assert applied.applied_at(b.hash) <= applied.applied_at(a.hash)
+            assert backend.get_applied_migration_hashes() == [b.hash, a.hash]
+
+
+class TestBulkBookkeeping(object):
+    def make_migrations(self, n):
+        return [
+            Mock(id="m{}".format(ix), hash="h{}".format(ix))
+            for ix in range(n)
+        ]
+
+    def log_count(self, backend):
+        return backend.execute(
+            "SELECT COUNT(1) FROM {0.log_table_quoted}".format(backend)
+        ).fetchone()[0]
+
+    def test_it_marks_in_one_statement(self, backend):
+        migrations = self.make_migrations(50)
+        backend.ensure_internal_schema_updated()
+        with patch.object(
+            backend, "execute_statement", wraps=backend.execute_statement
+        ) as execute, patch.object(
+            backend,
+            "executemany_statement",
+            wraps=backend.executemany_statement,
+        ) as executemany:
+            backend.mark_migrations(migrations)
+            assert execute.call_count == 0
+            assert [c[0][0] for c in executemany.call_args_list] == [
+                "mark_migration",
+                "log_migration",
+            ]
+        assert backend.get_applied_migration_hashes() == [
+            m.hash for m in migrations
+        ]
+        assert self.log_count(backend) == 50
+
+    def test_it_does_not_recompile_statements(self, backend):
+        migrations = self.make_migrations(4)
+        backend.mark_migrations(migrations[:2])
+        backend.unmark_migrations(migrations[:1])
+        with patch("yoyo.utils.compile_param_style") as compile_param_style:
+            backend.mark_migrations(migrations[2:])
+            backend.unmark_migrations(migrations[2:3])
+            assert compile_param_style.call_count == 0
+        assert backend.get_applied_migration_hashes() == ["h1", "h3"]
+
+    def test_it_unmarks_in_chunks(self, backend):
+        migrations = self.make_migrations(25)
+        backend.mark_migrations(migrations)
+        backend.max_bind_params = 10
+        with patch.object(
+            backend, "execute_statement", wraps=backend.execute_statement
+        ) as execute:
+            backend.unmark_migrations(migrations[:-1])
+            assert [c[0][0] for c in execute.call_args_list] == [
+                "unmark_migration_10",
+                "unmark_migration_10",
+                "unmark_migration_4",
+            ]
+        assert backend.get_applied_migration_hashes() == [
+            migrations[-1].hash
+        ]
+        assert self.log_count(backend) == 49
+
+    def test_it_updates_applied_migrations_while_locked(self, backend):
+        migrations = self.make_migrations(3)
+        with backend.lock():
+            backend.get_applied_migrations()
+            backend.mark_migrations(migrations)
+            backend.unmark_migrations(migrations[:1])
+            with patch.object(backend, "execute") as execute:
+                assert backend.get_applied_migration_hashes() == [
+                    "h1",
+                    "h2",
+                ]
+                assert execute.call_count == 0
+
+
+class TestApplyOne(object):
+    def test_it_commits_once_per_migration(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(
+            a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')"
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            backend.ensure_internal_schema_updated()
+            with patch.object(backend, "commit", wraps=backend.commit) as c:
+                backend.apply_one(migrations[0])
+                assert c.call_count == 1
+                backend.rollback_one(migrations[0])
+                assert c.call_count == 2
+            assert backend.get_applied_migration_hashes() == []
+
+    def test_it_does_not_record_failed_migrations(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(
+            a="""
+            step("CREATE TABLE yoyo_a (id INT)")
+            step("INSERT INTO yoyo_a VALUES ('x', 'y')")
+            """
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(backend.DatabaseError):
+                backend.apply_one(migrations[0])
+            assert backend.get_applied_migration_hashes() == []
+            assert (
+                backend.execute(
+                    "SELECT COUNT(1) FROM {0.log_table_quoted}".format(backend)
+                ).fetchone()[0]
+                == 0
+            )
+            assert "yoyo_a" not in backend.list_tables()
+
+
+class TestSingleTransaction(object):
+    migrations = {
+        "a": "step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')",
+        "b": "step('CREATE TABLE yoyo_b (id INT)', 'DROP TABLE yoyo_b')",
+        "post-apply": "step('INSERT INTO yoyo_a VALUES (1)')",
+    }
+
+    def test_it_applies_migrations_in_one_transaction(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(**self.migrations) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            backend.ensure_internal_schema_updated()
+            with patch.object(backend, "commit", wraps=backend.commit) as c:
+                backend.apply_migrations(migrations, single_transaction=True)
+                assert c.call_count == 1
+            assert len(backend.get_applied_migration_hashes()) == 2
+            assert backend.execute("SELECT * FROM yoyo_a").fetchall() == [
+                (1,)
+            ]
+
+    def test_it_rolls_back_all_migrations_on_error(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(
+            c="step('INSERT INTO yoyo_b VALUES (1, 2)')", **self.migrations
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(backend.DatabaseError):
+                backend.apply_migrations(migrations, single_transaction=True)
+            assert backend.get_applied_migration_hashes() == []
+            assert "yoyo_a" not in backend.list_tables()
+
+    def test_it_applies_nothing_if_a_migration_fails_to_load(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(
+            c='__depends__ = {"b"}\nraise RuntimeError()',
+            d=(
+                '__depends__ = {"c"}\n'
+                "step('CREATE TABLE yoyo_d (id INT)', 'DROP TABLE yoyo_d')"
+            ),
+            **self.migrations
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(exceptions.BadMigration):
+                backend.apply_migrations(migrations, single_transaction=True)
+            assert backend.get_applied_migration_hashes() == []
+            tables = backend.list_tables()
+            assert "yoyo_a" not in tables
+            assert "yoyo_d" not in tables
+
+    def test_it_rolls_back_if_a_migration_fails_to_load(self, backend):
+        if not backend.has_transactional_ddl:
+            pytest.skip("Backend does not support transactional DDL")
+        with with_migrations(
+            c='__depends__ = {"b"}\nraise RuntimeError()', **self.migrations
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            # Skip the check made before the transaction starts
+            with patch.object(backend, "check_single_transaction"):
+                with pytest.raises(exceptions.BadMigration):
+                    backend.apply_migrations(
+                        migrations, single_transaction=True
+                    )
+            assert backend.get_applied_migration_hashes() == []
+            assert "yoyo_a" not in backend.list_tables()
+
+    def test_it_refuses_non_transactional_migrations(self, backend):
+        with with_migrations(
+            c="__transactional__ = False\nstep('SELECT 1')", **self.migrations
+        ) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(exceptions.SingleTransactionUnavailable):
+                backend.apply_migrations(migrations, single_transaction=True)
+            assert backend.get_applied_migration_hashes() == []
+
+    def test_it_refuses_backends_without_transactional_ddl(self, backend):
+        backend.has_transactional_ddl = False
+        with with_migrations(**self.migrations) as tmpdir:
+            migrations = read_migrations(tmpdir)
+            with pytest.raises(exceptions.SingleTransactionUnavailable):
+                backend.apply_migrations(migrations, single_transaction=True)
+            assert backend.get_applied_migration_hashes() == []
+
+
+class TestLogData(object):
+    def setup_method(self):
+        backends.get_username.cache_clear()
+        backends.get_hostname.cache_clear()
+
+    teardown_method = setup_method
+
+    def test_it_looks_up_host_identity_once(self, backend):
+        with patch("socket.getfqdn", return_value="a.example") as getfqdn:
+            for operation in ["apply", "rollback", "mark"]:
+                data = backend.get_log_data(operation=operation)
+                assert data["hostname"] == "a.example"
+        assert getfqdn.call_count == 1
+
+    def test_it_reads_host_identity_from_environment(self, backend):
+        with patch.dict(
+            "os.environ", {"YOYO_USERNAME": "u", "YOYO_HOSTNAME": "h"}
+        ), patch("socket.getfqdn") as getfqdn:
+            data = backend.get_log_data()
+            assert (data["username"], data["hostname"]) == ("u", "h")
+            assert getfqdn.call_count == 0
+
+    def test_backend_attributes_override_host_identity(self, backend):
+        backend.log_username = "u"
+        backend.log_hostname = "h"
+        with patch("socket.getfqdn") as getfqdn:
+            data = backend.get_log_data()
+            assert (data["username"], data["hostname"]) == ("u", "h")
+            assert getfqdn.call_count == 0
+
+
 class TestConcurrency(object):
 
     # How long to lock for: long enough to allow a migration to be loaded and
@@ -208,6 +517,197 @@ class TestConcurrency(object):
         thread.join()
 
 
+class TestNativeLocks(object):
+    class LockTimeoutError(Exception):
+        pgcode = "55P03"
+
+    def make_backend(self, backend_class, results):
+        """
+        Return a backend whose queries return the values in ``results``,
+        keyed on the name of the SQL function called
+        """
+
+        class MockBackend(backend_class):
+            driver = Mock(DatabaseError=Exception, paramstyle="format")
+
+            def connect(self, dburi):
+                return Mock()
+
+            def quote_identifier(self, s):
+                return s
+
+        backend = MockBackend(Mock(database="db", args={}), "_yoyo_migration")
+        cursor = backend.connection.cursor()
+        cursor.execute.reset_mock()
+
+        def execute(sql, params=None):
+            for name, result in results.items():
+                if name + "(" in sql:
+                    if isinstance(result, Exception):
+                        raise result
+                    cursor.fetchone.return_value = (result,)
+
+        cursor.execute.side_effect = execute
+        return backend
+
+    def executed(self, backend):
+        return [
+            c[0][0] for c in backend.connection.cursor().execute.call_args_list
+        ]
+
+    def test_postgresql_uses_advisory_lock(self):
+        backend = self.make_backend(
+            backends.PostgresqlBackend, {"pg_try_advisory_lock": True}
+        )
+        with backend.lock():
+            assert not any("yoyo_lock" in s for s in self.executed(backend))
+        assert any("pg_advisory_unlock" in s for s in self.executed(backend))
+        assert not any(
+            "pg_advisory_lock(" in s for s in self.executed(backend)
+        )
+
+    def test_postgresql_waits_for_advisory_lock(self):
+        backend = self.make_backend(
+            backends.PostgresqlBackend,
+            {"pg_try_advisory_lock": False, "pg_advisory_lock": None},
+        )
+        with backend.lock(timeout=2.5):
+            executed = self.executed(backend)
+            assert "SET LOCAL lock_timeout = 2500" in executed
+            assert any("pg_advisory_lock(" in s for s in executed)
+
+    def test_postgresql_raises_lock_timeout(self):
+        backend = self.make_backend(
+            backends.PostgresqlBackend,
+            {
+                "pg_try_advisory_lock": False,
+                "pg_advisory_lock": self.LockTimeoutError(),
+            },
+        )
+        with pytest.raises(exceptions.LockTimeout):
+            with backend.lock():
+                pass
+        executed = self.executed(backend)
+        assert not any("pg_advisory_unlock" in s for s in executed)
+
+    def test_postgresql_lock_key_depends_on_table_and_schema(self):
+        backend = self.make_backend(backends.PostgresqlBackend, {})
+        key = backend.lock_key
+        assert -(2 ** 63) <= key < 2 ** 63
+        backend.schema = "foo"
+        assert backend.lock_key != key
+        backend.schema = None
+        backend.migration_table = "other"
+        assert backend.lock_key != key
+
+    def test_mysql_uses_named_lock(self):
+        backend = self.make_backend(backends.MySQLBackend, {"GET_LOCK": 1})
+        with backend.lock():
+            pass
+        executed = self.executed(backend)
+        assert any("GET_LOCK" in s for s in executed)
+        assert any("RELEASE_LOCK" in s for s in executed)
+        assert not any("yoyo_lock" in s for s in executed)
+        assert len(backend.lock_name) <= 64
+
+    def test_mysql_raises_lock_timeout(self):
+        backend = self.make_backend(backends.MySQLBackend, {"GET_LOCK": 0})
+        with pytest.raises(exceptions.LockTimeout):
+            with backend.lock():
+                pass
+        assert not any("RELEASE_LOCK" in s for s in self.executed(backend))
+
+    def test_postgresql_break_lock_reports_lock_holder(self):
+        backend = self.make_backend(
+            backends.PostgresqlBackend, {"current_database": 4321}
+        )
+        with pytest.raises(exceptions.LockHeld) as excinfo:
+            backend.break_lock()
+        assert "pg_terminate_backend(4321)" in str(excinfo.value)
+        cursor = backend.connection.cursor()
+        params = cursor.execute.call_args_list[-1][0][1]
+        classid, objid = params
+        key = (classid << 32) | objid
+        assert key == backend.lock_key & 0xFFFFFFFFFFFFFFFF
+        assert any("yoyo_lock" in s for s in self.executed(backend))
+
+    def test_postgresql_break_lock_when_lock_is_free(self):
+        backend = self.make_backend(backends.PostgresqlBackend, {})
+        backend.connection.cursor().fetchone.return_value = None
+        backend.break_lock()
+        assert any("pg_locks" in s for s in self.executed(backend))
+
+    def test_mysql_break_lock_reports_lock_holder(self):
+        backend = self.make_backend(
+            backends.MySQLBackend, {"IS_USED_LOCK": 12}
+        )
+        with pytest.raises(exceptions.LockHeld) as excinfo:
+            backend.break_lock()
+        assert "KILL 12" in str(excinfo.value)
+        assert any("yoyo_lock" in s for s in self.executed(backend))
+
+    def test_mysql_break_lock_when_lock_is_free(self):
+        backend = self.make_backend(
+            backends.MySQLBackend, {"IS_USED_LOCK": None}
+        )
+        backend.break_lock()
+        assert any("IS_USED_LOCK" in s for s in self.executed(backend))
+
+
+class TestMySQLQuoting(object):
+    def make_backend(self, sql_mode):
+        class MockMySQLBackend(backends.MySQLBackend):
+            driver = Mock(DatabaseError=Exception, paramstyle="format")
+
+            def connect(self, dburi):
+                connection = Mock()
+                connection.cursor().fetchone.return_value = (
+                    "sql_mode",
+                    sql_mode,
+                )
+                return connection
+
+        return MockMySQLBackend(
+            Mock(database="db", args={}), "_yoyo_migration"
+        )
+
+    def count_sql_mode_queries(self, backend):
+        return sum(
+            1
+            for c in backend.connection.cursor().execute.call_args_list
+            if "sql_mode" in c[0][0]
+        )
+
+    def test_it_reads_sql_mode_once_per_connection(self):
+        backend = self.make_backend("STRICT_TRANS_TABLES")
+        for _ in range(3):
+            assert backend.migration_table_quoted == "`_yoyo_migration`"
+            assert backend.log_table_quoted == "`_yoyo_log`"
+        backend.rollback()
+        assert backend.migration_table_quoted == "`_yoyo_migration`"
+        assert self.count_sql_mode_queries(backend) == 1
+
+        backend._connection = backend.connect(backend.uri)
+        backend.init_connection(backend.connection)
+        assert backend.migration_table_quoted == "`_yoyo_migration`"
+        assert self.count_sql_mode_queries(backend) == 1
+
+    def test_it_recompiles_statements_on_reconnect(self):
+        backend = self.make_backend("STRICT_TRANS_TABLES")
+        assert "`yoyo_lock`" in backend.statements["break_lock"].sql
+        backend._connection = backend.connect(backend.uri)
+        backend._connection.cursor().fetchone.return_value = (
+            "sql_mode",
+            "ANSI_QUOTES",
+        )
+        backend.init_connection(backend.connection)
+        assert '"yoyo_lock"' in backend.statements["break_lock"].sql
+
+    def test_it_uses_ansi_quotes(self):
+        backend = self.make_backend("ANSI_QUOTES,STRICT_TRANS_TABLES")
+        assert backend.migration_table_quoted == '"_yoyo_migration"'
+
+
 class TestInitConnection(object):
     class MockBackend(backends.DatabaseBackend):
         driver = Mock(DatabaseError=Exception, paramstyle="format")
@@ -286,3 +786,41 @@ class TestInitConnection(object):
                     "ALTER DATABASE {} RESET SEARCH_PATH".format(dbname)
                 )
                 backend.execute("DROP SCHEMA custom_schema CASCADE")
+
+
+class TestLazyInitialization(object):
+    dburi = "sqlite:///:memory:"
+
+    def test_it_does_not_probe_on_construction(self):
+        with patch.object(backends.SQLiteBackend, "execute") as execute:
+            backend = get_backend(self.dburi)
+            assert execute.call_count == 0
+        assert backend.has_transactional_ddl is True
+
+    def test_it_creates_the_lock_table_when_locking(self):
+        backend = get_backend(self.dburi)
+        assert "yoyo_lock" not in backend.list_tables()
+        with backend.lock():
+            assert "yoyo_lock" in backend.list_tables()
+
+    def test_it_reads_transactional_ddl_from_uri(self):
+        backend = get_backend(self.dburi + "?transactional_ddl=false")
+        assert backend.has_transactional_ddl is False
+        with pytest.raises(ValueError):
+            get_backend(self.dburi + "?transactional_ddl=maybe")
+
+    def test_it_probes_unknown_backends_once(self):
+        class MockBackend(backends.DatabaseBackend):
+            driver = Mock(DatabaseError=Exception, paramstyle="format")
+
+            def connect(self, dburi):
+                return Mock()
+
+        with patch.object(
+            MockBackend, "_check_transactional_ddl", return_value=True
+        ) as check:
+            backend = MockBackend(Mock(args={}), "")
+            assert check.call_count == 0
+            assert backend.has_transactional_ddl is True
+            assert backend.has_transactional_ddl is True
+            assert check.call_count == 1
@@ -0,0 +1,138 @@
+import os
+
+from mock import patch
+
+from yoyo import read_migrations
+from yoyo.cache import SQLMigrationCache
+from yoyo.migrations import parse_sql_migration
+from yoyo.tests import migrations_dir
+from yoyo.tests import tempdir
+
+
+def write(path, content):
+    with open(path, "w", encoding="UTF-8") as f:
+        f.write(content)
+
+
+class TestSQLMigrationCache(object):
+    def test_it_parses_on_first_read(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            path = os.path.join(tmp, "1.sql")
+            write(path, "-- depends: 0\nSELECT 1;\nSELECT 2")
+            cache = SQLMigrationCache(cache_dir)
+            directives, leading_comment, statements = cache.read(
+                path, parse_sql_migration
+            )
+            assert directives == {"depends": "0"}
+            assert statements == ["SELECT 1;", "SELECT 2"]
+            assert os.path.exists(cache.entry_path(path))
+
+    def test_it_does_not_reparse_unchanged_files(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            path = os.path.join(tmp, "1.sql")
+            write(path, "SELECT 1")
+            SQLMigrationCache(cache_dir).read(path, parse_sql_migration)
+
+            def fail(s):
+                raise AssertionError("File was parsed again")
+
+            result = SQLMigrationCache(cache_dir).read(path, fail)
+            assert result == [{}, "", ["SELECT 1"]]
+
+    def test_it_reuses_entry_if_only_mtime_changed(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            path = os.path.join(tmp, "1.sql")
+            write(path, "SELECT 1")
+            cache = SQLMigrationCache(cache_dir)
+            cache.read(path, parse_sql_migration)
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+            def fail(s):
+                raise AssertionError("File was parsed again")
+
+            assert cache.read(path, fail) == [{}, "", ["SELECT 1"]]
+
+    def test_it_invalidates_changed_files(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            path = os.path.join(tmp, "1.sql")
+            write(path, "SELECT 1")
+            cache = SQLMigrationCache(cache_dir)
+            cache.read(path, parse_sql_migration)
+            write(path, "SELECT 1; SELECT 2")
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            _, _, statements = cache.read(path, parse_sql_migration)
+            assert statements == ["SELECT 1;", "SELECT 2"]
+
+    def test_it_invalidates_entries_from_other_parsers(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            path = os.path.join(tmp, "1.sql")
+            write(path, "SELECT 1")
+            cache = SQLMigrationCache(cache_dir)
+            cache.read(path, parse_sql_migration, parser_id="a")
+            with patch(
+                "yoyo.tests.test_cache.parse_sql_migration",
+                wraps=parse_sql_migration,
+            ) as parse:
+                cache.read(path, parse, parser_id="b")
+                assert parse.call_count == 1
+
+    def test_it_evicts_least_recently_used_entries(self):
+        with tempdir() as cache_dir, tempdir() as tmp:
+            paths = [os.path.join(tmp, "{}.sql".format(n)) for n in range(3)]
+            for p in paths:
+                write(p, "SELECT 1")
+            cache = SQLMigrationCache(cache_dir)
+            for ix, p in enumerate(paths):
+                cache.read(p, parse_sql_migration)
+                os.utime(cache.entry_path(p), ns=(ix, ix))
+            entry_size = os.stat(cache.entry_path(paths[0])).st_size
+
+            # Reading paths[0] marks it as the most recently used entry
+            cache.read(paths[0], parse_sql_migration)
+            cache.evict(max_size=entry_size * 2)
+            assert os.path.exists(cache.entry_path(paths[0]))
+            assert not os.path.exists(cache.entry_path(paths[1]))
+            assert os.path.exists(cache.entry_path(paths[2]))
+
+
+def test_read_migrations_uses_cache():
+    with tempdir() as cache_dir:
+        with migrations_dir(
+            **{
+                "1.sql": "CREATE TABLE foo (id int)",
+                "1.rollback.sql": "DROP TABLE foo",
+            }
+        ) as tmp:
+            m = read_migrations(tmp, cache_dir=cache_dir)[0]
+            m.load()
+            assert len(os.listdir(cache_dir)) == 1
+            m.load_rollback()
+            assert len(os.listdir(cache_dir)) == 2
+
+            with patch(
+                "yoyo.migrations.parse_sql_migration"
+            ) as parse_sql_migration:
+                m = read_migrations(tmp, cache_dir=cache_dir)[0]
+                m.load_rollback()
+                assert parse_sql_migration.call_count == 0
+            assert m.steps[0].step._apply == "CREATE TABLE foo (id int)"
+            assert m.steps[0].step._rollback == "DROP TABLE foo"
+
+
+def test_read_migrations_sets_cache_max_size():
+    with tempdir() as cache_dir:
+        with migrations_dir(
+            **{"1.sql": "SELECT 1", "2.sql": "SELECT 2"}
+        ) as tmp:
+            migrations = read_migrations(
+                tmp, cache_dir=cache_dir, cache_max_size=1024, jobs=2
+            )
+            assert migrations[0].cache.max_size == 1024
+            assert len(os.listdir(cache_dir)) == 2
+            migrations = read_migrations(tmp, cache_dir=cache_dir)
+            assert (
+                migrations[0].cache.max_size
+                == SQLMigrationCache(cache_dir).max_size
+            )
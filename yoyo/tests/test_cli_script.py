@@ -29,12 +29,15 @@ import frozendate
 import pytest
 import tms
 
+from yoyo import exceptions
 from yoyo import read_migrations
 from yoyo.config import get_configparser
+from yoyo.migrations import MigrationList
 from yoyo.tests import with_migrations, dburi
 from yoyo.tests import get_backend
 from yoyo.scripts.main import main, parse_args, LEGACY_CONFIG_FILENAME
 from yoyo.scripts import newmigration
+from yoyo.scripts.migrate import prompt_migrations
 
 
 def is_tmpfile(p, directory=None):
@@ -126,6 +129,68 @@ class TestYoyoScript(TestInteractiveScript):
                 "sqlite://user:fish@/:memory", "_yoyo_migration"
             )
 
+    @with_migrations(a="")
+    def test_it_uses_log_identity_from_config(self, tmpdir):
+        self.writeconfig(log_username="deployer", log_hostname="deploybox")
+        main(["-b", "apply", tmpdir, "--database", self.dburi])
+        backend = get_backend(self.dburi)
+        assert backend.execute(
+            "SELECT username, hostname FROM _yoyo_log"
+        ).fetchall() == [("deployer", "deploybox")]
+
+    @with_migrations(a='step("SELECT 1 AS n")')
+    def test_it_configures_step_output(self, tmpdir):
+        with patch("yoyo.migrations.write_results") as write_results:
+            main(
+                [
+                    "-b",
+                    "apply",
+                    tmpdir,
+                    "--database",
+                    self.dburi,
+                    "--output",
+                    "summary",
+                    "--output-max-rows",
+                    "10",
+                ]
+            )
+        args = write_results.call_args[0]
+        assert args[2:] == ("summary", 10)
+
+    @with_migrations()
+    def test_it_rejects_bad_output_options_from_config(self, tmpdir):
+        for option, message in [
+            ({"output": "xml"}, "Unknown output mode 'xml'"),
+            ({"output_max_rows": "-1"}, "must be 0 or more"),
+        ]:
+            self.writeconfig(**option)
+            with patch("argparse.ArgumentParser.error") as error, patch(
+                "yoyo.connections.get_backend"
+            ) as get_backend:
+                main(["-b", "apply", tmpdir, "--database", self.dburi])
+                assert message in error.call_args[0][0]
+                assert get_backend.call_count == 0
+
+    @with_migrations()
+    def test_it_rejects_negative_output_max_rows(self, tmpdir):
+        with pytest.raises(SystemExit):
+            main(["apply", tmpdir, "--output-max-rows", "-1"])
+
+    @with_migrations()
+    def test_it_rejects_negative_jobs(self, tmpdir):
+        with pytest.raises(SystemExit):
+            main(["apply", tmpdir, "--jobs", "-1"])
+
+    @with_migrations()
+    def test_it_rejects_negative_jobs_from_config(self, tmpdir):
+        self.writeconfig(jobs="-1")
+        with patch("argparse.ArgumentParser.error") as error, patch(
+            "yoyo.scripts.migrate.read_migrations"
+        ) as read_migrations:
+            main(["-b", "apply", tmpdir, "--database", self.dburi])
+            assert "jobs must be 0 or more" in error.call_args[0][0]
+            assert read_migrations.call_count == 0
+
     @with_migrations()
     def test_it_prompts_migrations(self, tmpdir):
         with patch(
@@ -144,6 +209,22 @@ class TestYoyoScript(TestInteractiveScript):
             assert get_backend().rollback_migrations.call_count == 0
             assert get_backend().apply_migrations.call_count == 1
 
+    @with_migrations(a="__transactional__ = False")
+    def test_it_refuses_single_transaction(self, tmpdir):
+        with patch("argparse.ArgumentParser.error") as error:
+            main(
+                [
+                    "-b",
+                    "apply",
+                    "--single-transaction",
+                    tmpdir,
+                    "--database",
+                    self.dburi,
+                ]
+            )
+            assert "cannot be run in a transaction" in error.call_args[0][0]
+        assert get_backend(self.dburi).get_applied_migration_hashes() == []
+
     @with_migrations()
     def test_it_rollsback_migrations(self, tmpdir):
         with patch("yoyo.scripts.migrate.get_backend") as get_backend:
@@ -265,6 +346,16 @@ class TestYoyoScript(TestInteractiveScript):
         ).fetchone()[0]
         assert lock_count == 0
 
+    def test_it_reports_locks_it_cannot_break(self):
+        with patch("yoyo.scripts.migrate.get_backend") as get_backend, patch(
+            "argparse.ArgumentParser.error"
+        ) as error:
+            get_backend().break_lock.side_effect = exceptions.LockHeld(
+                "held by 123"
+            )
+            main(["break-lock", "--database", dburi])
+            assert error.call_args == call("held by 123")
+
 
 class TestArgParsing(TestInteractiveScript):
     def test_it_uses_config_file_defaults(self):
@@ -537,3 +628,15 @@ class TestNewMigration(TestInteractiveScript):
 
                 """
             )
+
+
+class TestPromptMigrations(TestInteractiveScript):
+    def test_it_reads_applied_status_once(self):
+        m1, m2 = Mock(id="m1"), Mock(id="m2")
+        backend = Mock()
+        backend.applied_status.return_value = {m1: True, m2: False}
+        prompt_migrations(backend, MigrationList([m1, m2]), "apply")
+        assert backend.applied_status.call_count == 1
+        assert backend.is_applied.call_count == 0
+        options = [args[1] for args, _ in self.prompt.call_args_list]
+        assert options == ["yNvdaqjk?", "Ynvdaqjk?"]
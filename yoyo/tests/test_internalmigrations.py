@@ -103,3 +103,13 @@ def test_v3_preserves_history_when_upgrading(backend):
             "this log entry created automatically by an internal schema upgrade",
         ),
     ]
+
+
+def test_get_current_version_does_not_list_tables(backend, monkeypatch):
+    clear_database(backend)
+    monkeypatch.setattr(backend, "list_tables", None)
+    assert internalmigrations.get_current_version(backend) == 0
+    internalmigrations.upgrade(backend, version=1)
+    assert internalmigrations.get_current_version(backend) == 1
+    internalmigrations.upgrade(backend)
+    assert internalmigrations.get_current_version(backend) == 2
@@ -17,16 +17,24 @@ from datetime import timedelta
 from mock import Mock, patch
 import io
 import os
+import sys
+import zipfile
+
 import pytest
 
 from yoyo.connections import get_backend
 from yoyo import read_migrations
 from yoyo import exceptions
+from yoyo import output
 from yoyo import ancestors, descendants
 
 from yoyo.tests import with_migrations, migrations_dir, dburi
 from yoyo.tests import tempdir
 from yoyo.migrations import topological_sort, MigrationList
+from yoyo.migrations import read_python_metadata
+from yoyo.migrations import read_sql_migration
+from yoyo.migrations import MigrationGraph
+from yoyo.migrations import StreamingSQLSteps
 from yoyo.scripts import newmigration
 
 
@@ -239,6 +247,30 @@ def test_migrations_display_selected_data(tmpdir):
         )
 
 
+@with_migrations(
+    a="""
+    step("CREATE TABLE yoyo_test (id INT)")
+    step("INSERT INTO yoyo_test VALUES (1)")
+    """,
+    b='step("SELECT * FROM yoyo_test")',
+)
+def test_migrations_only_open_output_file_for_rows(tmpdir):
+    backend = get_backend(dburi)
+    migrations = read_migrations(tmpdir)
+    output_file = os.path.join(tmpdir, "output.txt")
+    backend.output_file = output_file
+    with patch(
+        "yoyo.migrations.open_output", wraps=output.open_output
+    ) as open_output:
+        backend.apply_migrations(migrations[:1])
+        assert open_output.call_count == 0
+        assert not os.path.exists(output_file)
+        backend.apply_migrations(migrations[1:])
+        assert open_output.call_count == 1
+    with open(output_file, encoding="UTF-8") as f:
+        assert f.read().endswith("(1 row)\n")
+
+
 def test_grouped_migrations_can_be_rolled_back(backend):
     with with_migrations(
         a="from yoyo import step\n"
@@ -269,6 +301,47 @@ def test_grouped_migrations_can_be_rolled_back(backend):
         backend.rollback_migrations(read_migrations(t1))
 
 
+class TestSavepoints(object):
+    source = """
+        step("CREATE TABLE yoyo_test (id INT)")
+        step("INSERT INTO yoyo_test VALUES (1)")
+        group(
+            step("INSERT INTO yoyo_test VALUES (2)"),
+            step("INSERT INTO yoyo_test VALUES (3)"),
+            ignore_errors="apply",
+        )
+        step("INSERT INTO yoyo_test VALUES (4)", ignore_errors="rollback")
+    """
+
+    def count_savepoints(self, backend, migration, **kwargs):
+        with patch.object(
+            backend, "savepoint", wraps=backend.savepoint
+        ) as savepoint:
+            backend.apply_one(migration, **kwargs)
+            return savepoint.call_count
+
+    def test_it_only_uses_savepoints_to_ignore_errors(self, backend):
+        with with_migrations(a=self.source) as tmpdir:
+            migration = read_migrations(tmpdir)[0]
+            # Only the group can ignore errors on apply
+            assert self.count_savepoints(backend, migration) == 1
+            assert backend.execute(
+                "SELECT id FROM yoyo_test ORDER BY id"
+            ).fetchall() == [(1,), (2,), (3,), (4,)]
+
+    def test_it_uses_savepoints_when_forced(self, backend):
+        with with_migrations(a=self.source) as tmpdir:
+            migration = read_migrations(tmpdir)[0]
+            assert self.count_savepoints(backend, migration, force=True) == 6
+
+    def test_it_logs_savepoints_avoided(self, backend, caplog):
+        with with_migrations(a=self.source) as tmpdir:
+            migration = read_migrations(tmpdir)[0]
+            with caplog.at_level("DEBUG", logger="yoyo.migrations"):
+                backend.apply_one(migration)
+            assert "Running a with 5 savepoints avoided" in caplog.messages
+
+
 class TestTopologicalSort(object):
     def get_mock_migrations(self):
         class MockMigration(Mock):
@@ -308,6 +381,25 @@ class TestTopologicalSort(object):
         with pytest.raises(exceptions.BadMigration):
             list(topological_sort([m1, m2, m3, m4]))
 
+    def test_it_reports_cycles_as_components(self):
+        m1, m2, m3, m4 = self.get_mock_migrations()
+        m1.depends.add(m2)
+        m2.depends.add(m1)
+        m3.depends.add(m3)
+        m4.depends.add(m1)
+        with pytest.raises(exceptions.BadMigration) as excinfo:
+            topological_sort([m1, m2, m3, m4])
+        assert str(excinfo.value) == (
+            "Circular dependencies among these migrations: m1, m2; m3"
+        )
+
+    def test_it_orders_independent_roots_by_position(self):
+        m1, m2, m3, m4 = self.get_mock_migrations()
+        m1.depends.add(m4)
+        m2.depends.add(m3)
+        assert list(topological_sort([m1, m2, m3, m4])) == [m3, m4, m2, m1]
+        assert list(topological_sort([m4, m3, m2, m1])) == [m4, m3, m1, m2]
+
     def test_it_handles_multiple_edges_to_the_same_node(self):
         m1, m2, m3, m4 = self.get_mock_migrations()
         m2.depends.add(m1)
@@ -388,6 +480,49 @@ class TestAncestorsDescendants(object):
         }
 
 
+class TestMigrationGraph(object):
+    def make_chain(self, length):
+        migrations = [Mock(id=str(n), depends=set()) for n in range(length)]
+        for a, b in zip(migrations, migrations[1:]):
+            b.depends = {a}
+        return migrations
+
+    def test_it_finds_ancestors_and_descendants(self):
+        migrations = self.make_chain(5000)
+        graph = MigrationGraph(migrations)
+        assert graph.descendants(migrations[0]) == set(migrations[1:])
+        assert graph.ancestors(migrations[-1]) == set(migrations[:-1])
+        assert graph.descendants(migrations[-1]) == set()
+        assert graph.heads() == {migrations[-1]}
+
+    def test_it_memoizes_results(self):
+        migrations = self.make_chain(3)
+        graph = MigrationGraph(migrations)
+        assert graph.descendants(migrations[0]) is graph.descendants(
+            migrations[0]
+        )
+        assert graph.ancestors(migrations[2]) is graph.ancestors(
+            migrations[2]
+        )
+
+    def test_migration_list_caches_graph(self):
+        migrations = MigrationList(self.make_chain(3))
+        graph = migrations.graph
+        assert migrations.graph is graph
+        assert descendants(migrations[0], migrations) == set(migrations[1:])
+
+        m = Mock(id="x", depends={migrations[2]})
+        migrations.append(m)
+        assert migrations.graph is not graph
+        assert descendants(migrations[0], migrations) == set(migrations[1:])
+
+    def test_adding_lists_does_not_modify_operands(self):
+        a = MigrationList(self.make_chain(2))
+        b = a + [Mock(id="x", depends=set())]
+        assert len(a) == 2
+        assert len(b) == 3
+
+
 class TestReadMigrations(object):
     @with_migrations(**{newmigration.tempfile_prefix + "test": ""})
     def test_it_ignores_yoyo_new_tmp_files(self, tmpdir):
@@ -425,11 +560,69 @@ class TestReadMigrations(object):
         m.load()
         assert len(m.steps) == 1
 
+    @with_migrations(a="from yoyo import step, group; group(step('SELECT 1'))")
+    def test_it_does_not_inspect_the_stack(self, tmpdir):
+        with patch("yoyo.migrations.inspect.stack") as stack:
+            m = read_migrations(tmpdir)[0]
+            m.load()
+            assert stack.call_count == 0
+        assert len(m.steps) == 1
+
+    def test_it_loads_migrations_concurrently(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        sources = {
+            "m{}".format(n): "\n".join(
+                "step('SELECT {}')".format(i) for i in range(n)
+            )
+            for n in range(1, 21)
+        }
+        with migrations_dir(**sources) as tmp:
+            migrations = read_migrations(tmp)
+            with ThreadPoolExecutor(8) as executor:
+                list(executor.map(lambda m: m.load(), migrations))
+            for m in migrations:
+                assert len(m.steps) == int(m.id[1:])
+
     def test_it_reads_from_package_data(self):
         migrations = read_migrations("package:yoyo:tests/migrations")
         assert len(migrations) == 1
         assert migrations[0].id == "test-pkg-migration"
 
+    def test_it_reads_from_zipped_packages(self, tmpdir, monkeypatch):
+        archive = os.path.join(str(tmpdir), "zipped.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("yoyo_zipped/__init__.py", "")
+            zf.writestr(
+                "yoyo_zipped/migrations/1.sql",
+                "-- transactional: false\nCREATE TABLE foo (id INT)",
+            )
+            zf.writestr(
+                "yoyo_zipped/migrations/1.rollback.sql", "DROP TABLE foo"
+            )
+            zf.writestr(
+                "yoyo_zipped/migrations/2.py",
+                "__depends__ = {'1'}\n"
+                "step('SELECT 1' if True else '')\n",
+            )
+        monkeypatch.syspath_prepend(archive)
+        monkeypatch.delitem(sys.modules, "yoyo_zipped", raising=False)
+
+        migrations = read_migrations(
+            "package:yoyo_zipped:migrations", jobs=2
+        )
+        assert [m.id for m in migrations] == ["1", "2"]
+        m1, m2 = migrations
+        assert m1.path.startswith(archive)
+        assert m1.use_transactions is False
+        assert m2.depends == {m1}
+        m1.load_rollback()
+        m2.load()
+        assert [(s.step._apply, s.step._rollback) for s in m1.steps] == [
+            ("CREATE TABLE foo (id INT)", "DROP TABLE foo")
+        ]
+        assert [s.step._apply for s in m2.steps] == ["SELECT 1"]
+
     def test_it_globs_directory_names(self):
         def touch(f):
             io.open(f, "w").close()
@@ -507,6 +700,286 @@ class TestReadMigrations(object):
         with pytest.raises(exceptions.BadMigration):
             check("-- depends: true\nSELECT 1", set())
 
+    def test_it_reads_sql_rollbacks_only_when_rolling_back(self, backend):
+        mdir = migrations_dir(
+            **{
+                "1.sql": "CREATE TABLE yoyo_r (id INT)",
+                "1.rollback.sql": "DROP TABLE yoyo_r",
+            }
+        )
+        with mdir as tmp, patch(
+            "yoyo.migrations.read_sql_migration",
+            wraps=read_sql_migration,
+        ) as read:
+            rollback_path = os.path.join(tmp, "1.rollback.sql")
+            migrations = read_migrations(tmp)
+            backend.apply_migrations(migrations)
+            assert rollback_path not in [c[0][0] for c in read.call_args_list]
+
+            backend.rollback_migrations(migrations)
+            assert rollback_path in [c[0][0] for c in read.call_args_list]
+            assert "yoyo_r" not in backend.list_tables()
+
+    def test_it_adds_steps_for_unpaired_rollback_statements(self):
+        mdir = migrations_dir(
+            **{"1.sql": "SELECT 1", "1.rollback.sql": "SELECT 3; SELECT 2"}
+        )
+        with mdir as tmp:
+            m = read_migrations(tmp)[0]
+            m.load()
+            assert [s.step._apply for s in m.steps] == ["SELECT 1"]
+            m.load_rollback()
+            assert [(s.step._apply, s.step._rollback) for s in m.steps] == [
+                ("SELECT 1", "SELECT 2"),
+                (None, "SELECT 3;"),
+            ]
+
+    def test_it_splits_sql_migrations_by_dialect(self):
+        sql = (
+            "-- depends: 1\n"
+            "DELIMITER //\n"
+            "CREATE PROCEDURE p() BEGIN SELECT 1; END//\n"
+            "DELIMITER ;\n"
+            "SELECT 2"
+        )
+        procedure = "CREATE PROCEDURE p() BEGIN SELECT 1; END"
+        with migrations_dir(**{"1.sql": "", "2.sql": sql}) as tmp:
+            for sql_dialect, expected in [
+                (None, "DELIMITER //\n" + procedure + "//\nDELIMITER ;"),
+                ("generic", "DELIMITER //\n" + procedure + "//\nDELIMITER ;"),
+                ("mysql", procedure),
+                ({tmp: "mysql"}, procedure),
+            ]:
+                migration = read_migrations(tmp, sql_dialect=sql_dialect)[-1]
+                migration.load()
+                assert [s.step._apply for s in migration.steps] == [
+                    expected,
+                    "SELECT 2",
+                ]
+                assert {m.id for m in migration.depends} == {"1"}
+
+            with pytest.raises(ValueError):
+                read_migrations(tmp, sql_dialect="cobol")
+
+            with pytest.raises(ValueError) as excinfo:
+                read_migrations(tmp, sql_dialect={tmp + "/": "mysql"})
+            assert repr(tmp + "/") in str(excinfo.value)
+
+
+class TestStreamingSQLMigrations(object):
+    @pytest.fixture(autouse=True)
+    def stream_all_files(self):
+        with patch("yoyo.migrations.STREAM_SQL_THRESHOLD", 0):
+            yield
+
+    def test_it_reads_metadata_without_loading_statements(self):
+        with migrations_dir(
+            **{"1.sql": "", "2.sql": "-- foo\n-- depends: 1\nSELECT 1;"}
+        ) as tmp:
+            migration = read_migrations(tmp)[-1]
+            with patch("yoyo.migrations.read_sql_migration") as read:
+                migration.load()
+            assert read.call_count == 0
+            assert isinstance(migration.steps, StreamingSQLSteps)
+            assert migration.module.__doc__ == "foo"
+            assert {m.id for m in migration.depends} == {"1"}
+            assert [s.step._apply for s in migration.steps] == ["SELECT 1;"]
+
+    def test_it_applies_and_rolls_back(self, backend):
+        with migrations_dir(
+            **{
+                "1.sql": "-- a comment\nCREATE TABLE yoyo_s (id INT);\n"
+                "INSERT INTO yoyo_s VALUES (1);\n"
+                "INSERT INTO yoyo_s VALUES (2);\n",
+                "1.rollback.sql": "DELETE FROM yoyo_s;\nDROP TABLE yoyo_s",
+            }
+        ) as tmp:
+            migrations = read_migrations(tmp)
+            backend.apply_migrations(migrations)
+            assert backend.execute(
+                "SELECT count(1) FROM yoyo_s"
+            ).fetchone() == (2,)
+            backend.rollback_migrations(migrations)
+            assert "yoyo_s" not in backend.list_tables()
+
+
+class TestReadPythonMetadata(object):
+    def check(self, source):
+        with migrations_dir(a=source) as tmp:
+            return read_python_metadata(os.path.join(tmp, "a.py"))
+
+    def test_it_reads_literal_values(self):
+        assert self.check(
+            '"""\ndoc\n"""\n'
+            '__depends__ = {"x", "y"}\n'
+            "__transactional__ = False\n"
+        ) == {"depends": {"x", "y"}, "transactional": False, "doc": "\ndoc\n"}
+
+    def test_it_supplies_defaults(self):
+        assert self.check("step('SELECT 1')") == {
+            "depends": [],
+            "transactional": True,
+            "doc": None,
+        }
+
+    def test_it_uses_the_last_assignment(self):
+        metadata = self.check("__depends__ = ['x']\n__depends__ = ['y']")
+        assert metadata["depends"] == ["y"]
+
+    def test_it_rejects_non_literal_values(self):
+        assert self.check("__depends__ = {'a' + 'b'}") is None
+        assert self.check("x = 'a'\n__depends__ = [x]") is None
+
+    def test_it_rejects_other_bindings(self):
+        assert self.check("__depends__ = []\n__depends__ += ['x']") is None
+        assert self.check("if True:\n    __transactional__ = False") is None
+        assert self.check("from m import x as __depends__") is None
+        assert self.check("from m import *") is None
+        assert self.check("__depends__, x = [], 1") is None
+
+    def test_it_rejects_invalid_python(self):
+        assert self.check("this is not valid python!") is None
+
+
+class TestLoadMetadata(object):
+    @with_migrations(
+        a="",
+        b="""
+        __depends__ = {'a'}
+        __transactional__ = False
+        raise AssertionError("module should not be executed")
+        """,
+    )
+    def test_it_does_not_execute_modules(self, tmpdir):
+        a, b = read_migrations(tmpdir)
+        assert b.depends == {a}
+        assert b.use_transactions is False
+        assert not b.loaded
+        with pytest.raises(exceptions.BadMigration):
+            b.load()
+
+    @with_migrations(
+        a="",
+        b="""
+        import os
+        __depends__ = {os.path.basename('a')}
+        """,
+    )
+    def test_it_executes_modules_with_non_literal_metadata(self, tmpdir):
+        a, b = read_migrations(tmpdir)
+        assert b.depends == {a}
+        assert b.loaded
+
+    @with_migrations(
+        a="""
+        '''
+        Create the table
+        '''
+        """
+    )
+    def test_it_reads_the_same_doc_as_loading(self, tmpdir):
+        [a] = read_migrations(tmpdir)
+        a.load_metadata()
+        doc = a.doc
+        assert not a.loaded
+        a.load()
+        assert a.doc == doc
+
+    @with_migrations(a="__depends__ = {'missing'}")
+    def test_it_does_not_record_unresolved_dependencies(self, tmpdir):
+        [a] = read_migrations(tmpdir)
+        for _ in range(2):
+            with pytest.raises(exceptions.BadMigration):
+                a.depends
+
+    @with_migrations(
+        a="step('CREATE TABLE yoyo_a (id INT)')",
+        b="""
+        __depends__ = {'a'}
+        import nonexistent_module
+        """,
+        c="""
+        __depends__ = {'b'}
+        step('CREATE TABLE yoyo_c (id INT)')
+        """,
+    )
+    def test_it_applies_nothing_if_a_migration_fails_to_load(self, tmpdir):
+        backend = get_backend(dburi)
+        migrations = backend.to_apply(read_migrations(tmpdir))
+        with pytest.raises(exceptions.BadMigration):
+            backend.apply_migrations(migrations)
+        assert backend.get_applied_migration_hashes() == []
+        tables = backend.list_tables()
+        assert "yoyo_a" not in tables
+        assert "yoyo_c" not in tables
+
+    @with_migrations(
+        a="step('CREATE TABLE yoyo_a (id INT)', 'DROP TABLE yoyo_a')",
+        b="__depends__ = {'a'}",
+        c="""
+        __depends__ = {'b'}
+        step('CREATE TABLE yoyo_c (id INT)', 'DROP TABLE yoyo_c')
+        """,
+    )
+    def test_it_rolls_back_nothing_if_a_migration_fails_to_load(self, tmpdir):
+        backend = get_backend(dburi)
+        backend.apply_migrations(read_migrations(tmpdir))
+        with open(os.path.join(tmpdir, "b.py"), "a") as f:
+            f.write("\nimport nonexistent_module\n")
+        migrations = backend.to_rollback(read_migrations(tmpdir))
+        with pytest.raises(exceptions.BadMigration):
+            backend.rollback_migrations(migrations)
+        assert len(backend.get_applied_migration_hashes()) == 3
+        assert "yoyo_c" in backend.list_tables()
+
+    @with_migrations(a="", b="__depends__ = {'a'}")
+    def test_to_apply_loads_only_metadata(self, tmpdir):
+        backend = get_backend(dburi)
+        migrations = backend.to_apply(read_migrations(tmpdir))
+        assert [m.id for m in migrations] == ["a", "b"]
+        assert not any(m.loaded for m in migrations)
+
+    def test_it_loads_metadata_in_worker_processes(self):
+        with migrations_dir(
+            **{
+                "a.sql": "CREATE TABLE a (id int)",
+                "a.rollback.sql": "DROP TABLE a",
+                "b": "__depends__ = {'a'}\nstep('SELECT 1')",
+                "c": "import os\n__depends__ = {os.path.basename('b')}",
+                "post-apply": "step('SELECT 1')",
+            }
+        ) as tmp:
+            migrations = read_migrations(tmp, jobs=2)
+            a, b, c = migrations
+            assert a.loaded
+            assert a.steps[0].step._apply == "CREATE TABLE a (id int)"
+            assert a.steps[0].step._rollback == "DROP TABLE a"
+            assert b._depends == {a} and not b.loaded
+            assert c._depends == {b} and c.loaded
+            assert migrations.post_apply[0]._depends == set()
+
+    def test_it_collects_errors_from_all_migrations(self):
+        with migrations_dir(
+            **{
+                "a.sql": "-- depends: x\nSELECT 1",
+                "b": "this is not valid python!",
+                "c": "__depends__ = {'y'}",
+                "d": "",
+            }
+        ) as tmp:
+            with pytest.raises(exceptions.BadMigration) as excinfo:
+                read_migrations(tmp, jobs=2)
+            message = str(excinfo.value)
+            assert message.startswith("Could not load 3 migrations:")
+            for name in ["a.sql", "b.py", "c.py"]:
+                assert os.path.join(tmp, name) in message
+            assert "d.py" not in message
+
+    def test_it_rejects_negative_jobs(self):
+        with migrations_dir(a="") as tmp:
+            with pytest.raises(ValueError):
+                read_migrations(tmp, jobs=-1)
+
 
 class TestPostApplyHooks(object):
     def test_post_apply_hooks_are_run_every_time(self):
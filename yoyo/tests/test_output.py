@@ -0,0 +1,86 @@
+from io import StringIO
+import os
+import sqlite3
+
+from mock import Mock
+import pytest
+
+from yoyo import output
+from yoyo.tests import tempdir
+
+
+def make_cursor(nrows):
+    cursor = sqlite3.connect(":memory:").cursor()
+    cursor.execute(
+        "WITH RECURSIVE n(id) AS "
+        "(SELECT 1 UNION ALL SELECT id + 1 FROM n WHERE id < ?) "
+        "SELECT id, 'x' || id AS name FROM n",
+        (nrows,),
+    )
+    return cursor
+
+
+def write(nrows, **kwargs):
+    out = StringIO()
+    output.write_results(make_cursor(nrows), out, **kwargs)
+    return out.getvalue()
+
+
+class TestWriteResults(object):
+    def test_it_writes_a_table(self):
+        assert write(2) == (
+            " id | name \n"
+            "----+------\n"
+            " 1  | x1   \n"
+            " 2  | x2   \n"
+            "(2 rows)\n"
+        )
+
+    def test_it_writes_a_summary(self):
+        assert write(1234, mode="summary") == "(1234 rows)\n"
+
+    def test_it_writes_nothing(self):
+        cursor = Mock(description=[("id",)])
+        out = StringIO()
+        output.write_results(cursor, out, mode="none")
+        assert out.getvalue() == ""
+        assert cursor.fetchmany.call_count == 0
+
+    def test_it_writes_csv(self):
+        assert write(2, mode="csv") == "id,name\r\n1,x1\r\n2,x2\r\n"
+
+    def test_it_truncates_output(self):
+        assert write(10, max_rows=1) == (
+            " id | name \n"
+            "----+------\n"
+            " 1  | x1   \n"
+            "(output truncated after 1 rows)\n"
+        )
+        assert write(1, max_rows=1).endswith("(1 row)\n")
+
+    def test_it_sizes_columns_from_a_sample(self, monkeypatch):
+        monkeypatch.setattr(output, "SAMPLE_ROWS", 2)
+        lines = write(100).splitlines()
+        assert lines[0] == " id | name "
+        assert lines[-2] == " 100 | x100 "
+
+    def test_it_reads_rows_in_batches(self):
+        cursor = make_cursor(output.FETCH_ROWS * 2 + 1)
+        cursor = Mock(wraps=cursor, description=cursor.description)
+        output.write_results(cursor, StringIO(), mode="summary")
+        assert cursor.fetchall.call_count == 0
+        assert cursor.fetchmany.call_count == 4
+
+    def test_it_rejects_unknown_modes(self):
+        with pytest.raises(ValueError):
+            write(1, mode="xml")
+
+
+def test_open_output_appends_to_file():
+    with tempdir() as tmp:
+        path = os.path.join(tmp, "out.csv")
+        for ix in range(2):
+            with output.open_output(path) as out:
+                out.write("{}\n".format(ix))
+        with open(path, encoding="UTF-8") as f:
+            assert f.read() == "0\n1\n"
@@ -0,0 +1,196 @@
+from io import StringIO
+import random
+
+import pytest
+import sqlparse
+
+from yoyo import sqlsplit
+
+examples = [
+    "SELECT 1;\nSELECT 2",
+    "SELECT 1; -- comment\nSELECT 2;",
+    "-- c\nSELECT 1;  \n\n-- d\nSELECT 2;\n-- trailing",
+    "SELECT 1; /* x */ SELECT 2;",
+    "SELECT 1;;SELECT 2",
+    "select 'a;b''c'; select \"d;e\", `f;g`; select 'h\\';'",
+    "SELECT 1 -- x;\n;",
+    "CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; $$ LANGUAGE sql;"
+    "SELECT $1;",
+    "CREATE FUNCTION f() RETURNS trigger AS $body$ BEGIN IF x THEN y; "
+    "END IF; RETURN NEW; END; $body$ LANGUAGE plpgsql; SELECT 2",
+    "CREATE TRIGGER t AFTER INSERT ON x BEGIN UPDATE y SET a=1; "
+    "DELETE FROM z; END; SELECT 1;",
+    "BEGIN; SELECT 1; COMMIT;",
+    "BEGIN TRANSACTION; SELECT 1; COMMIT",
+    "CREATE PROCEDURE p() BEGIN WHILE x DO SET x = x - 1; END WHILE; "
+    "IF y THEN SELECT 1; END IF; END; SELECT 3",
+    "CREATE PROCEDURE p() BEGIN DROP TABLE IF EXISTS t; END; SELECT 1",
+    "SELECT CASE WHEN 1 THEN 2 END; SELECT t.end FROM t; SELECT 4",
+    "DECLARE x int; BEGIN x := 1; END; SELECT 1",
+]
+
+
+@pytest.mark.parametrize("sql", examples)
+def test_it_splits_like_sqlparse(sql):
+    assert sqlsplit.split(sql) == sqlparse.split(sql)
+
+
+@pytest.mark.parametrize("sql", examples)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7])
+def test_it_splits_across_chunks(sql, chunk_size):
+    statements = sqlsplit.iter_statements(StringIO(sql), chunk_size)
+    assert list(statements) == sqlsplit.split(sql)
+
+
+def test_it_reads_incrementally():
+    class File(StringIO):
+        chars_read = 0
+
+        def read(self, size=-1):
+            result = super(File, self).read(size)
+            self.chars_read += len(result)
+            return result
+
+    sql = "SELECT 1;\n" * 10000
+    f = File(sql)
+    statements = sqlsplit.iter_statements(f, chunk_size=100)
+    assert next(statements) == "SELECT 1;"
+    assert f.chars_read < 1000
+    assert len(list(statements)) == 9999
+
+
+#: Fragments from which scripts are generated to compare the generic
+#: splitter with sqlparse
+# fmt: off
+fragments = [
+    "SELECT", " ", "\n", "1", ";", ",", "(", ")", "x", "t.end",
+    "'a;b'", '"x;y"', "`c;`", "[b;]", "E'\\';'", "q'[a;]'",
+    "-- c;\n", "#x;\n", "/* m; */", "$$", "$a$",
+    "BEGIN", "END", "CASE", "IF", "CREATE", "TRIGGER", "PROCEDURE",
+    "DECLARE", "LOOP", "WHILE", "DO", "FOR", "TRANSACTION",
+]
+# fmt: on
+
+
+def generate_scripts(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        size = rng.randint(1, 25)
+        yield "".join(rng.choice(fragments) for _ in range(size))
+
+
+def test_it_splits_generated_scripts_like_sqlparse():
+    for sql in generate_scripts(500):
+        assert sqlsplit.split(sql) == sqlparse.split(sql), sql
+
+
+@pytest.mark.parametrize("dialect", sorted(sqlsplit.DIALECTS))
+def test_dialects_split_generated_scripts_across_chunks(dialect):
+    for sql in generate_scripts(100):
+        statements = sqlsplit.iter_statements(StringIO(sql), 3, dialect)
+        assert list(statements) == sqlsplit.split(sql, dialect), sql
+
+
+def test_it_rejects_unknown_dialects():
+    with pytest.raises(ValueError):
+        sqlsplit.split("SELECT 1", "cobol")
+
+
+dialect_examples = [
+    (
+        "postgresql",
+        "CREATE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END; $$ "
+        "LANGUAGE plpgsql; SELECT f()",
+        [
+            "CREATE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END; $$ "
+            "LANGUAGE plpgsql;",
+            "SELECT f()",
+        ],
+    ),
+    (
+        "postgresql",
+        "SELECT E'a\\';b', 'c\\'; /* a /* b; */ c; */ SELECT 2",
+        ["SELECT E'a\\';b', 'c\\';", "/* a /* b; */ c; */ SELECT 2"],
+    ),
+    (
+        "postgresql",
+        "CREATE FUNCTION f() RETURNS int BEGIN ATOMIC SELECT 1; SELECT 2; "
+        "END; SELECT 3",
+        [
+            "CREATE FUNCTION f() RETURNS int BEGIN ATOMIC SELECT 1; SELECT 2; "
+            "END;",
+            "SELECT 3",
+        ],
+    ),
+    (
+        "postgresql",
+        "BEGIN; SELECT 1; COMMIT;",
+        ["BEGIN;", "SELECT 1;", "COMMIT;"],
+    ),
+    (
+        "mysql",
+        "DELIMITER //\nCREATE PROCEDURE p() BEGIN SELECT 1; END//\n"
+        "DELIMITER ;\nSELECT 2; # x;\nSELECT 3",
+        [
+            "CREATE PROCEDURE p() BEGIN SELECT 1; END",
+            "SELECT 2; # x;",
+            "SELECT 3",
+        ],
+    ),
+    (
+        "mysql",
+        "-- a\nDELIMITER $$\nSELECT 1$$ SELECT 2 $$\nDELIMITER ;\nSELECT 3",
+        ["-- a\nSELECT 1", "SELECT 2", "SELECT 3"],
+    ),
+    (
+        "mysql",
+        "SELECT 1--1; SELECT 2",
+        ["SELECT 1--1;", "SELECT 2"],
+    ),
+    (
+        "oracle",
+        "CREATE OR REPLACE PROCEDURE p AS BEGIN NULL; END;\n/\n"
+        "SELECT 1 FROM dual;\nDECLARE x NUMBER; BEGIN x := 1; END;\n/\n"
+        "SELECT q'[a;b]' FROM dual;",
+        [
+            "CREATE OR REPLACE PROCEDURE p AS BEGIN NULL; END;",
+            "SELECT 1 FROM dual;",
+            "DECLARE x NUMBER; BEGIN x := 1; END;",
+            "SELECT q'[a;b]' FROM dual;",
+        ],
+    ),
+    (
+        "oracle",
+        "SELECT 4 / 2 FROM dual;\nCREATE TABLE t (id NUMBER);",
+        ["SELECT 4 / 2 FROM dual;", "CREATE TABLE t (id NUMBER);"],
+    ),
+    (
+        "sqlite",
+        "CREATE TRIGGER t AFTER INSERT ON x BEGIN "
+        "UPDATE y SET a = CASE WHEN 1 THEN 2 END; DELETE FROM z; END; "
+        "SELECT [a;b]; BEGIN; SELECT 1; COMMIT;",
+        [
+            "CREATE TRIGGER t AFTER INSERT ON x BEGIN "
+            "UPDATE y SET a = CASE WHEN 1 THEN 2 END; DELETE FROM z; END;",
+            "SELECT [a;b];",
+            "BEGIN;",
+            "SELECT 1;",
+            "COMMIT;",
+        ],
+    ),
+    (
+        "sqlite",
+        "SELECT 'a\\'; SELECT 2",
+        ["SELECT 'a\\';", "SELECT 2"],
+    ),
+]
+
+
+@pytest.mark.parametrize("dialect,sql,expected", dialect_examples)
+def test_dialects(dialect, sql, expected):
+    assert sqlsplit.split(sql, dialect) == expected
+    for chunk_size in [1, 2, 7]:
+        statements = sqlsplit.iter_statements(
+            StringIO(sql), chunk_size, dialect
+        )
+        assert list(statements) == expected
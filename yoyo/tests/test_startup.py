@@ -0,0 +1,129 @@
+import os
+import re
+import subprocess
+import sys
+
+
+#: Code run by ``yoyo apply`` before it reads migrations or connects to the
+#: database
+apply_startup = (
+    "from yoyo.scripts.main import parse_args; "
+    "parse_args(['--no-config-file', 'apply', 'migrations'])"
+)
+
+#: Standard library imports that ``yoyo`` cannot avoid. Timings depend on
+#: the machine, so the imports made by ``apply_startup`` are timed relative
+#: to these
+baseline_startup = "import argparse, configparser, getpass, logging"
+
+#: The default time budget for ``apply_startup``, as a multiple of the time
+#: taken by ``baseline_startup``
+startup_budget_factor = 4
+
+#: Environment variable overriding the time budget with a fixed number of
+#: milliseconds (eg ``YOYO_STARTUP_BUDGET=100`` on a CI runner known to
+#: meet it)
+startup_budget_var = "YOYO_STARTUP_BUDGET"
+
+#: Modules that should only be imported when they are used
+deferred_modules = [
+    "concurrent.futures.process",
+    "sqlparse",
+    "text_unidecode",
+    "yoyo.scripts.newmigration",
+    "yoyo.sqlsplit",
+    "sqlite3",
+    "psycopg2",
+    "pymysql",
+    "MySQLdb",
+    "cx_Oracle",
+    "pyodbc",
+]
+
+
+def imported_modules(code):
+    """
+    Return the names of all modules imported by running ``code`` in a new
+    interpreter
+    """
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "{}\nimport sys\nprint('\\n'.join(sys.modules))".format(code),
+        ],
+        universal_newlines=True,
+    )
+    return set(output.splitlines())
+
+
+def test_import_does_not_load_package_resources():
+    modules = imported_modules("import yoyo")
+    assert "pkg_resources" not in modules
+    assert "importlib.resources" not in modules
+
+
+def test_reading_directories_does_not_load_package_resources(tmpdir):
+    modules = imported_modules(
+        "import yoyo; yoyo.read_migrations({!r})".format(str(tmpdir))
+    )
+    assert "pkg_resources" not in modules
+    assert "importlib.resources" not in modules
+
+
+def import_time(code, pycache_prefix):
+    """
+    Return the total time in milliseconds spent importing modules when
+    running ``code`` in a new interpreter, as reported by
+    ``python -X importtime``
+    """
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache_prefix)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+        check=True,
+    ).stderr
+    # Lines are "import time: <self us> | <cumulative us> | <module>", with
+    # the module name indented according to its depth in the import tree.
+    # The top level imports' cumulative times add up to the total.
+    toplevel = re.findall(
+        r"^import time:\s+\d+ \|\s+(\d+) \| \S", output, re.M
+    )
+    return sum(int(us) for us in toplevel) / 1000
+
+
+def test_apply_startup_does_not_load_unused_modules():
+    modules = imported_modules(apply_startup)
+    assert "yoyo.scripts.migrate" in modules
+    assert modules.isdisjoint(deferred_modules)
+
+
+def test_help_loads_all_commands():
+    modules = imported_modules(
+        "from yoyo.scripts.main import make_argparser; make_argparser()"
+    )
+    assert "yoyo.scripts.migrate" in modules
+    assert "yoyo.scripts.newmigration" in modules
+
+
+def test_apply_startup_is_within_budget(tmpdir):
+    # Write bytecode to a scratch directory on the first run, so that later
+    # runs are timed as they would be in an installed package
+    import_time(baseline_startup, str(tmpdir))
+    import_time(apply_startup, str(tmpdir))
+    baseline = elapsed = float("inf")
+    for _ in range(5):
+        baseline = min(baseline, import_time(baseline_startup, str(tmpdir)))
+        elapsed = min(elapsed, import_time(apply_startup, str(tmpdir)))
+    if startup_budget_var in os.environ:
+        startup_budget = float(os.environ[startup_budget_var])
+    else:
+        startup_budget = round(baseline * startup_budget_factor, 1)
+    assert elapsed < startup_budget, (
+        "Imports for yoyo apply took {:.1f}ms (budget: {}ms). Run "
+        "python -X importtime -c {!r} to see which modules "
+        "were loaded".format(elapsed, startup_budget, apply_startup)
+    )
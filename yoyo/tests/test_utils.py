@@ -36,3 +36,48 @@ class TestChangeParamStyle:
             "SELECT :a, :b, :a",
             {"a": 1, "b": 2},
         )
+
+    def test_it_caches_compiled_statements(self):
+        sql = "SELECT :a, :b -- cache test"
+        before = utils.compile_param_style.cache_info()
+        for _ in range(3):
+            assert utils.change_param_style(
+                "numeric", sql, {"b": 2, "a": 1}
+            ) == ("SELECT :1, :2 -- cache test", (1, 2))
+        after = utils.compile_param_style.cache_info()
+        assert after.misses - before.misses == 1
+        assert after.hits - before.hits == 2
+
+    def test_it_only_changes_given_parameters(self):
+        sql = "SELECT :a, ':b', x::INT"
+        assert utils.change_param_style("qmark", sql, {"a": 1}) == (
+            "SELECT ?, ':b', x::INT",
+            (1,),
+        )
+
+
+class TestCompileParamStyle:
+    def test_it_compiles_positional_styles(self):
+        sql = "SELECT :a, :b, x::INT, :a"
+        for style, expected in [
+            ("qmark", "SELECT ?, ?, x::INT, ?"),
+            ("numeric", "SELECT :1, :2, x::INT, :3"),
+            ("format", "SELECT %s, %s, x::INT, %s"),
+        ]:
+            statement = utils.compile_param_style(style, sql)
+            assert statement.sql == expected
+            assert statement.bind({"a": 1, "b": 2}) == (1, 2, 1)
+
+    def test_it_numbers_each_statement_from_one(self):
+        for _ in range(2):
+            statement = utils.compile_param_style("numeric", "SELECT :a")
+            assert statement.sql == "SELECT :1"
+
+    def test_it_compiles_dict_styles(self):
+        sql = "SELECT :a, :b"
+        statement = utils.compile_param_style("pyformat", sql)
+        assert statement.sql == "SELECT %(a)s, %(b)s"
+        assert statement.bind({"a": 1, "b": 2}) == {"a": 1, "b": 2}
+        statement = utils.compile_param_style("named", sql)
+        assert statement.sql == sql
+        assert statement.bind(None) == {}
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import namedtuple
+from functools import lru_cache
 from itertools import count
 import configparser
 import os
@@ -140,30 +142,78 @@ def change_param_style(target_style, sql, bind_parameters):
     if not bind_parameters:
         return (sql, (tuple() if positional else {}))
 
-    param_gen = {
-        "qmark": lambda name: "?",
-        "numeric": lambda name, c=count(1): ":{}".format(next(c)),
-        "format": lambda name: "%s",
-        "pyformat": lambda name: "%({})s".format(name),
-    }[target_style]
-
-    pattern = re.compile(
-        # Don't match if preceded by backslash (an escape)
-        # or ':' (an SQL cast, eg '::INT')
-        r"(?<![:\\])"
-        # one of the given bind_parameters
-        r":("
-        + "|".join(re.escape(k) for k in bind_parameters)
-        + r")"
-        # followed by a non-word char, or end of string
-        r"(?=\W|$)"
+    statement = compile_param_style(
+        target_style, sql, tuple(sorted(bind_parameters))
     )
+    return statement.sql, statement.bind(bind_parameters)
+
+
+#: Matches named bind parameters (eg ':foo'), but not SQL casts (eg '::INT')
+#: or escaped colons
+named_param_pattern = re.compile(r"(?<![:\\]):([A-Za-z_]\w*)(?=\W|$)")
+
+
+class CompiledStatement(namedtuple("CompiledStatement", "sql param_order")):
+    """
+    An SQL statement rewritten for a DBAPI paramstyle.
+
+    ``param_order`` is a tuple of bind parameter names in the order the
+    driver expects them, or ``None`` if the driver takes a dict of
+    parameters.
+    """
 
-    transformed_sql = pattern.sub(lambda match: param_gen(match.group(1)), sql)
-    if positional:
-        positional_params = []
-        for match in pattern.finditer(sql):
-            param_name = match.group(1)
-            positional_params.append(bind_parameters[param_name])
-        return transformed_sql, tuple(positional_params)
-    return transformed_sql, bind_parameters
+    def bind(self, params):
+        """
+        Return ``params`` (a dict) in the form expected by the driver
+        """
+        if self.param_order is None:
+            return params or {}
+        return tuple(params[name] for name in self.param_order)
+
+
+@lru_cache(maxsize=512)
+def compile_param_style(target_style, sql, param_names=None):
+    """
+    Rewrite named bind parameters in ``sql`` for the DBAPI paramstyle
+    ``target_style``. Results are cached, so that repeated statements are
+    only scanned once.
+
+    :param param_names: a tuple of the names of the bind parameters to
+                        rewrite. If ``None``, all named parameters are
+                        rewritten.
+    :return: a :class:`CompiledStatement`
+    """
+    if target_style == "named":
+        return CompiledStatement(sql, None)
+    if param_names is None:
+        pattern = named_param_pattern
+    else:
+        pattern = re.compile(
+            # Don't match if preceded by backslash (an escape)
+            # or ':' (an SQL cast, eg '::INT')
+            r"(?<![:\\])"
+            # one of the given bind_parameters
+            r":("
+            + "|".join(re.escape(k) for k in param_names)
+            + r")"
+            # followed by a non-word char, or end of string
+            r"(?=\W|$)"
+        )
+    param_gen = {
+        "qmark": lambda name, c: "?",
+        "numeric": lambda name, c: ":{}".format(next(c)),
+        "format": lambda name, c: "%s",
+        "pyformat": lambda name, c: "%({})s".format(name),
+    }[target_style]
+    names = []
+    # Numbering for the 'numeric' style restarts for each statement
+    counter = count(1)
+
+    def replace(match):
+        names.append(match.group(1))
+        return param_gen(match.group(1), counter)
+
+    sql = pattern.sub(replace, sql)
+    if target_style == "pyformat":
+        return CompiledStatement(sql, None)
+    return CompiledStatement(sql, tuple(names))